@@ -12,3 +12,7 @@ main_module = importlib.import_module("invconv.ax-invconv")
 for attr in dir(main_module):
     if attr not in globals():
         globals()[attr] = getattr(main_module, attr)
+
+# Library interface for doing conversions without going
+# through the command line (see conversion.py).
+from invconv.conversion import Conversion, convert
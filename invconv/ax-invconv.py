@@ -7,45 +7,96 @@ import argparse
 import os
 import sys
 
-from alive_progress import alive_bar
 from loguru import logger
 
 # Script can also be used as a module.
+# (Modules that are only needed once a conversion
+# is actually started are imported in main(), so that
+# options such as --help don't have to wait on them.
+# metrics, profiling and sink do the same with tracemalloc,
+# cProfile and the compression modules.)
 try:
-    import axm
     import builtin_types
+    import cache
     import common
     import ftype
-    from exceptions import InvconvArgumentError
-    import logic
+    from exceptions import InvconvArgumentError, InvconvStopped
+    import metrics
     import msg_handler
+    import profiling
+    import sink
 except ModuleNotFoundError:
     # Disable logging by default
     # when imported in another script.
     logger.disable("invconv")
-    import invconv.axm as axm
     import invconv.builtin_types as builtin_types
+    import invconv.cache as cache
     import invconv.common as common
     import invconv.ftype as ftype
-    from invconv.exceptions import InvconvArgumentError
-    import invconv.logic as logic
+    from invconv.exceptions import InvconvArgumentError, InvconvStopped
+    import invconv.metrics as metrics
     import invconv.msg_handler as msg_handler
+    import invconv.profiling as profiling
+    import invconv.sink as sink
 
 
-@logger.catch(level="CRITICAL")
+# InvconvStopped is raised once the conversion has been stopped
+# because of --on-error=fail, which has already been logged.
+@logger.catch(level="CRITICAL", exclude=InvconvStopped)
 def main(arg_dict=None):
     if arg_dict is None:
         arg_dict = get_arg_dict()
     if not isinstance(arg_dict, dict):
         raise InvconvArgumentError
+    msg_handler.error_policy = arg_dict.get("on_error")
+    if arg_dict.get("serve"):
+        serve(arg_dict)
+        return
+    if arg_dict.get("daemon"):
+        submit(arg_dict)
+        return
+    if arg_dict.get("batch"):
+        run_batch(arg_dict)
+        return
+    logic, alive_bar, conversion = import_converter()
+    # Every conversion uses the same module globals, so nothing else
+    # can convert anything until this one is done (see conversion.py).
+    with conversion.lock:
+        run_conversion(arg_dict, logic, alive_bar, conversion)
+
+
+# Converts the input files given in arg_dict.
+def run_conversion(arg_dict, logic, alive_bar, conversion):
+    # main() might have been run before, so everything left
+    # over from then is thrown away and the data file is loaded
+    # again (most likely from the cache).
+    conversion.reset()
+    metrics.reset()
+    # Memory use is recorded as part of the metrics, but
+    # can be written to the log without writing the metrics.
+    metrics.is_enabled = bool(arg_dict.get("metrics") or arg_dict.get("memtrace"))
+    if arg_dict.get("memtrace", False):
+        metrics.start_memory_trace()
+    profiling.reset()
+    profiling.profile_dir = arg_dict.get("profile")
+    cache.is_enabled = not arg_dict.get("no_cache", False)
+    with metrics.stage("load_data"):
+        common.load(arg_dict.get("data_file", "demo.ini"))
     try:
         input_files = arg_dict["input"]
         map_file = arg_dict["map_file"]
         common.is_debug = arg_dict["debug"]
         file_type = arg_dict["type"]
-        common.output_file_path = get_proper_output(arg_dict["output"])
+        is_sharded = bool(arg_dict.get("shard_rows") or arg_dict.get("shard_bytes"))
+        # The output file itself isn't written to if it is
+        # split into shards, so it isn't created either.
+        common.output_file_path = get_proper_output(
+            arg_dict["output"], replace=not is_sharded
+        )
     except KeyError:
         raise InvconvArgumentError
+    if is_sharded and not isinstance(common.output_file_path, str):
+        raise InvconvArgumentError
     # Set up logger.
     # (If any errors occured before
     # this point, it would be handled
@@ -59,14 +110,12 @@ def main(arg_dict=None):
 
     # Run the function for the proper file type.
     type_func = ftype.get_func(file_type)
-    data_list = type_func(input_files)
+    with metrics.stage("discover"), profiling.stage("discover"):
+        data_list = type_func(input_files)
 
     # Figure out the proper mapping between Axelor CSV and input headers.
-    axm.parser.init(data_list.headers())
-    with open(map_file) as map_fptr:
-        while not axm.utils.is_eof(map_fptr):
-            axm.parser.parse(map_fptr)
-    axm.parser.finalize()
+    with metrics.stage("compile_map"), profiling.stage("compile_map"):
+        conversion.compile_map(map_file, data_list.headers())
 
     # Setup progress bar.
     max_num_oper = 0
@@ -79,21 +128,240 @@ def main(arg_dict=None):
         bar_theme_settings = {"bar": "classic2", "spinner": "classic"}
 
     # Convert input file to Axelor-compatible CSV.
-    logic.commit_headers()
-    with alive_bar(
-        max_num_oper, title="Generating output", **bar_theme_settings
-    ) as progress_bar:
-        while (parser_tuple := data_list.parser()) is not None:
-            filename, sectionname, header_list, content = parser_tuple
-            # When outputting text to stderr or stdout,
-            # pieces of the string printed by the
-            # progress_bar occasionally ends up
-            # within the text.
-            if isinstance(common.output_file_path, str):
-                progress_bar.text(msg_handler.get_id((filename, sectionname)))
-            logic.init(filename, sectionname, header_list)
-            logic.main(content)
+    if is_sharded:
+        shard_sink = output_sink = sink.ShardedSink(
+            common.output_file_path,
+            arg_dict.get("shard_rows"),
+            arg_dict.get("shard_bytes"),
+        )
+    else:
+        output_sink = sink.CsvSink(common.output_file_path)
+    logic.set_sink(output_sink)
+    try:
+        logic.commit_headers()
+        if metrics.is_enabled:
+            output_sink = metrics.MeteredSink(output_sink)
+            logic.set_sink(output_sink)
+        if profiling.profile_dir is not None:
+            output_sink = profiling.ProfiledSink(output_sink)
+            logic.set_sink(output_sink)
+        with alive_bar(
+            max_num_oper, title="Generating output", **bar_theme_settings
+        ) as progress_bar:
+            with metrics.stage("convert", sections=True), profiling.stage("transform"):
+                if arg_dict.get("jobs", 1) > 1:
+                    run_chunked(
+                        data_list,
+                        output_sink,
+                        progress_bar,
+                        arg_dict["jobs"],
+                        arg_dict.get("chunk_rows"),
+                    )
+                elif arg_dict.get("pipeline", False):
+                    run_pipeline(data_list, output_sink, progress_bar)
+                else:
+                    run_sequential(logic, data_list, progress_bar)
+        msg_handler.flush_warnings()
+        if msg_handler.get_error_policy() == msg_handler.POLICY_COLLECT:
+            write_error_report(arg_dict)
+    except BaseException:
+        # The manifest of the shards says the output is incomplete.
+        if is_sharded:
+            shard_sink.is_complete = False
+        raise
+    finally:
+        logic.set_sink(None)
+        output_sink.close()
+        if arg_dict.get("memtrace", False):
+            metrics.stop_memory_trace()
+        if arg_dict.get("metrics"):
+            write_metrics(arg_dict)
+        if profiling.profile_dir is not None:
+            profiling.save()
+
+
+# Goes through the input one row at a time, converting
+# every value of the row before reading the next one.
+def run_sequential(logic, data_list, progress_bar):
+    for data_tuple in data_list:
+        file_section = (data_tuple.filename, data_tuple.sectionname)
+        # When outputting text to stderr or stdout,
+        # pieces of the string printed by the
+        # progress_bar occasionally ends up
+        # within the text.
+        if isinstance(common.output_file_path, str):
+            progress_bar.text(msg_handler.get_id(file_section))
+        logic.init(data_tuple.filename, data_tuple.sectionname, data_tuple.headers)
+        for row in data_tuple.rows():
+            for val in row:
+                logic.main(val)
+                progress_bar()
+            if metrics.is_enabled:
+                metrics.progress(file_section, len(row))
+
+
+# Reads, converts and writes the input at the same time
+# (see pipeline.py). The output is the same as run_sequential().
+def run_pipeline(data_list, output_sink, progress_bar):
+    try:
+        import pipeline
+    except ModuleNotFoundError:
+        import invconv.pipeline as pipeline
+
+    pipeline.run(data_list, output_sink, get_batch_progress(progress_bar))
+
+
+# Converts ranges of rows in separate processes (see chunked.py).
+# The output is the same as run_sequential().
+def run_chunked(data_list, output_sink, progress_bar, num_jobs, chunk_rows=None):
+    try:
+        import chunked
+    except ModuleNotFoundError:
+        import invconv.chunked as chunked
+
+    if chunk_rows is None:
+        chunk_rows = chunked.DEFAULT_CHUNK_ROWS
+    chunked.run(
+        data_list,
+        output_sink,
+        num_jobs,
+        chunk_rows,
+        get_batch_progress(progress_bar),
+    )
+
+
+# Returns a function that moves progress_bar forward
+# once a number of cells have been converted at once.
+def get_batch_progress(progress_bar):
+    def progress(file_section, num_cells):
+        if isinstance(common.output_file_path, str):
+            progress_bar.text(msg_handler.get_id(file_section))
+        for _ in range(num_cells):
             progress_bar()
+        if metrics.is_enabled:
+            metrics.progress(file_section, num_cells)
+
+    return progress
+
+
+# Writes what was skipped or replaced by a default value with
+# --on-error=collect. The report goes next to the log file
+# unless given with --error-report.
+def write_error_report(arg_dict):
+    report_path = arg_dict.get("error_report")
+    if not report_path:
+        report_path = os.path.splitext(arg_dict["log_file"])[0] + "-errors.json"
+    msg_handler.write_report(report_path)
+    logger.info(f"Error report written to {report_path}.")
+
+
+# Writes the metrics recorded during the conversion (see metrics.py).
+def write_metrics(arg_dict):
+    mode = "sequential"
+    if arg_dict.get("jobs", 1) > 1:
+        mode = "chunked"
+    elif arg_dict.get("pipeline", False):
+        mode = "pipeline"
+    info_dict = {
+        "version": __version__.strip(),
+        "inputs": [os.path.abspath(input_file) for input_file in arg_dict["input"]],
+        "map_file": os.path.abspath(arg_dict["map_file"]),
+        "mode": mode,
+        "jobs": arg_dict.get("jobs", 1),
+    }
+    metrics.write(arg_dict["metrics"], info_dict)
+    logger.info(f"Metrics written to {arg_dict['metrics']}.")
+
+
+# Runs as a daemon that converts jobs sent to it (see daemon.py).
+def serve(arg_dict):
+    try:
+        import daemon
+    except ModuleNotFoundError:
+        import invconv.daemon as daemon
+
+    cache.is_enabled = not arg_dict.get("no_cache", False)
+    common.is_debug = arg_dict.get("debug", False)
+    msg_handler.init()
+    msg_handler.set_log(arg_dict["log_file"])
+    daemon.serve(
+        arg_dict["serve"],
+        arg_dict["map_file"],
+        arg_dict.get("data_file", "demo.ini"),
+        use_cache=cache.is_enabled,
+    )
+
+
+# Has a daemon started with --serve do the conversion.
+def submit(arg_dict):
+    try:
+        import daemon
+    except ModuleNotFoundError:
+        import invconv.daemon as daemon
+
+    try:
+        common.is_debug = arg_dict["debug"]
+        common.output_file_path = get_proper_output(arg_dict["output"])
+        job_dict = {
+            "map_file": arg_dict["map_file"],
+            "data_file": arg_dict.get("data_file", "demo.ini"),
+            "file_type": arg_dict["type"],
+            "fallback": get_fallback_dict(arg_dict),
+        }
+        input_files = arg_dict["input"]
+    except KeyError:
+        raise InvconvArgumentError
+    msg_handler.init()
+    msg_handler.set_log(arg_dict["log_file"])
+    if isinstance(common.output_file_path, str):
+        with sink.open_output(common.output_file_path) as output_fptr:
+            timing_dict = daemon.submit(
+                arg_dict["daemon"], input_files, output_fptr, **job_dict
+            )
+    else:
+        timing_dict = daemon.submit(
+            arg_dict["daemon"], input_files, common.output_file_path, **job_dict
+        )
+    logger.info(
+        f"Daemon converted {timing_dict['rows']} rows in {timing_dict['total']:.3f}s "
+        f"(loading took {timing_dict['load']:.3f}s)."
+    )
+
+
+# Runs every job listed in a manifest (see batch.py).
+def run_batch(arg_dict):
+    try:
+        import batch
+    except ModuleNotFoundError:
+        import invconv.batch as batch
+
+    common.is_debug = arg_dict.get("debug", False)
+    msg_handler.init()
+    msg_handler.set_log(arg_dict["log_file"])
+    job_list = batch.load_manifest(arg_dict["batch"])
+    result_list = batch.run(
+        job_list,
+        arg_dict.get("jobs", 1),
+        use_cache=not arg_dict.get("no_cache", False),
+    )
+    print(batch.get_summary(result_list))
+    if any(job_result.error is not None for job_result in result_list):
+        sys.exit(1)
+
+
+# Imports everything that is only needed to convert files.
+# openpyxl, alive_progress and the axm package all take a
+# noticeable amount of time to import.
+def import_converter():
+    from alive_progress import alive_bar
+
+    try:
+        import conversion
+        import logic
+    except ModuleNotFoundError:
+        import invconv.conversion as conversion
+        import invconv.logic as logic
+    return logic, alive_bar, conversion
 
 
 def get_arg_dict():
@@ -103,9 +371,14 @@ def get_arg_dict():
         add_help=False,
     )
     parser.add_argument("-d", "--data-file", default="demo.ini", help="INI data file")
-    data_file = parser.parse_known_args()[0].data_file
-    with open(data_file) as data_fptr:
-        common.init(data_fptr)
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Parse everything again instead of using cached results",
+    )
+    known_args = parser.parse_known_args()[0]
+    cache.is_enabled = not known_args.no_cache
+    common.load(known_args.data_file)
 
     parser.add_argument("-m", "--map-file", default="default.axm", help="AXM map file")
     parser.add_argument(
@@ -141,15 +414,99 @@ def get_arg_dict():
             help=help_text,
         )
 
-    parser.add_argument("input", nargs="+", help="Input file(s)")
     parser.add_argument(
-        "-o", "--output", default="", help="File or path to place csv file"
+        "--pipeline",
+        action="store_true",
+        help="Read, convert and write the input at the same time",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="Number of processes used to convert large sections (or jobs with --batch)",
+    )
+    parser.add_argument(
+        "--chunk-rows",
+        type=int,
+        default=None,
+        help="Number of rows converted at a time by each process (with --jobs)",
+    )
+    parser.add_argument(
+        "--serve",
+        metavar="SOCKET",
+        help="Wait for conversion jobs on a Unix domain socket",
+    )
+    parser.add_argument(
+        "--daemon",
+        metavar="SOCKET",
+        help="Have the daemon listening on a Unix domain socket do the conversion",
+    )
+    parser.add_argument(
+        "--shard-rows",
+        type=int,
+        metavar="N",
+        help="Split the output into files of at most N rows each",
+    )
+    parser.add_argument(
+        "--shard-bytes",
+        type=int,
+        metavar="N",
+        help="Split the output into files of about N bytes each (before compression)",
+    )
+    parser.add_argument(
+        "--on-error",
+        choices=msg_handler.POLICY_TUPLE,
+        default=None,
+        help="What to do about a worksheet that can't be converted"
+        " (prompt when run in a terminal, fail otherwise)",
+    )
+    parser.add_argument(
+        "--error-report",
+        metavar="FILE",
+        help="Where to write the JSON report of --on-error=collect",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="FILE",
+        help="Write the time taken by each stage of the conversion to a JSON file",
+    )
+    parser.add_argument(
+        "--profile",
+        metavar="DIR",
+        help="Profile each stage of the conversion and save the results in DIR",
+    )
+    parser.add_argument(
+        "--memtrace",
+        action="store_true",
+        help="Log the memory used by each stage of the conversion (and add it to --metrics)",
+    )
+    parser.add_argument(
+        "--batch",
+        metavar="MANIFEST",
+        help="Run every job listed in a JSON or TOML manifest",
+    )
+    # Input files aren't needed with --serve or --batch.
+    parser.add_argument("input", nargs="*", help="Input file(s)")
+    parser.add_argument(
+        "-o",
+        "--output",
+        default="",
+        help="File or path to place csv file (can end in .gz, .xz or .zst to compress it)",
     )
     parser_dict = vars(parser.parse_args())
+    if not parser_dict["input"] and not (parser_dict["serve"] or parser_dict["batch"]):
+        parser.error("the following arguments are required: input")
+    for shard_key in ("shard_rows", "shard_bytes"):
+        if parser_dict[shard_key] is not None and parser_dict[shard_key] < 1:
+            parser.error(
+                f"argument --{shard_key.replace('_', '-')}: must be at least 1"
+            )
     return parser_dict
 
 
-def get_proper_output(output_path):
+# Unless replace is False, the output file is emptied (or created).
+def get_proper_output(output_path, replace=True):
     output_file = ""
     if common.is_debug:
         if output_path.endswith("stdout"):
@@ -160,18 +517,7 @@ def get_proper_output(output_path):
         # to avoid InvconvArgumentError.
         if output_file:
             return output_file
-    # Checks if a file already exists (which gets replaced) or if
-    # ".csv" exists in output_path (in which case, file gets created).
-    if os.path.isfile(output_path) or output_path.endswith(".csv"):
-        output_file = output_path
-        # Replace the file if it already existed.
-        with open(output_file, "w", newline=""):
-            pass
-    elif os.path.isdir(output_path):
-        output_file = os.path.join(output_path, common.axelor_csv_type.title() + ".csv")
-    else:
-        raise InvconvArgumentError
-    return output_file
+    return sink.get_output_path(output_path, common.axelor_csv_type, replace)
 
 
 def set_fallback(arg_dict):
@@ -180,10 +526,18 @@ def set_fallback(arg_dict):
     # with the user-provided values. If the user didn't override
     # the default fallback values, then the fallback values
     # in the dict will be replaced with the values it currently has.
+    common.fallback.update(get_fallback_dict(arg_dict))
+
+
+# Returns the fallback values given in arg_dict,
+# indexed by the name of their section.
+def get_fallback_dict(arg_dict):
+    fallback_dict = {}
     for section_name, arg_tuple in common.arg_dict.items():
         long_arg = arg_tuple.long
         key = long_arg.removeprefix("--").replace("-", "_")
-        common.fallback[section_name] = arg_dict[key]
+        fallback_dict[section_name] = arg_dict[key]
+    return fallback_dict
 
 
 __version__ = "Unknown"
@@ -201,4 +555,7 @@ if os.name == "nt":
     os.system("")
 
 if __name__ == "__main__":
-    main()
+    try:
+        main()
+    except InvconvStopped:
+        sys.exit(msg_handler.USER_ERROR_CODE)
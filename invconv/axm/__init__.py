@@ -6,6 +6,7 @@ try:
     import axm.command as command
     import axm.common as common
     import axm.exceptions as exceptions
+    import axm.lexer as lexer
     import axm.operator as operator
     import axm.output as output
     import axm.parser as parser
@@ -16,6 +17,7 @@ except ModuleNotFoundError:
     import invconv.axm.command as command
     import invconv.axm.common as common
     import invconv.axm.exceptions as exceptions
+    import invconv.axm.lexer as lexer
     import invconv.axm.operator as operator
     import invconv.axm.output as output
     import invconv.axm.parser as parser
@@ -2,6 +2,7 @@
 # SPDX-license-identifier: 0BSD
 
 import collections
+import collections.abc
 
 try:
     import axm.common as common
@@ -14,6 +15,7 @@ try:
     )
     import axm.scheduler as scheduler
     import axm.struct as struct
+    import axm.utils as utils
 except ModuleNotFoundError:
     import invconv.axm.common as common
     from invconv.axm.exceptions import (
@@ -25,6 +27,7 @@ except ModuleNotFoundError:
     )
     import invconv.axm.scheduler as scheduler
     import invconv.axm.struct as struct
+    import invconv.axm.utils as utils
 
 CommandTuple = collections.namedtuple(
     "CommandTuple", ("name", "check_func", "action_func")
@@ -100,6 +103,19 @@ def get(name):
 ###    The basic commands available with axm and supporting functions.    ###
 
 # Checks the version of the axm file.
+# Describes every command that has been added, the
+# same as operator.get_signature() does for operators.
+def get_signature():
+    return [
+        (
+            command.name,
+            utils.get_func_name(command.check_func),
+            utils.get_func_name(command.action_func),
+        )
+        for command in _command_list
+    ]
+
+
 def _check_axm(line):
     test_line = line.lstrip()
     if COMMAND_PREFIX + "AXM" in test_line:
@@ -226,9 +242,6 @@ def _post_del():
 
 if get("DEL") is None:
     add("DEL", _check_del, _act_del)
-    scheduler.add(common.specialize, scheduler.NICE_INHERIT, [common.del_dict])
-    scheduler.add(common.inherit, scheduler.NICE_INHERIT, [common.del_dict])
-    scheduler.add(_post_del, scheduler.NICE_DEL_N_AVOID)
 
 # Similar to the !DEL command, except works on sect structures.
 def _check_avoid(line):
@@ -259,12 +272,20 @@ def _post_avoid(table):
                 # entries for the same section in a given list.
                 while section in table:
                     table.remove(section)
-            if isinstance(table, dict):
+            if isinstance(table, collections.abc.MutableMapping):
                 del table[section]
 
 
 if get("AVOID") is None:
     add("AVOID", _check_avoid, _act_avoid)
+
+
+# Adds the steps needed by the !DEL and !AVOID commands
+# to the scheduler.
+def schedule():
+    scheduler.add(common.specialize, scheduler.NICE_INHERIT, [common.del_dict])
+    scheduler.add(common.inherit, scheduler.NICE_INHERIT, [common.del_dict])
+    scheduler.add(_post_del, scheduler.NICE_DEL_N_AVOID)
     scheduler.add(common.specialize, scheduler.NICE_INHERIT, [common.avoid_list])
     scheduler.add(_post_avoid, scheduler.NICE_DEL_N_AVOID, [common.out_input_col])
     scheduler.add(_post_avoid, scheduler.NICE_DEL_N_AVOID, [common.opt_dict])
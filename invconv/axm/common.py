@@ -2,7 +2,9 @@
 # SPDX-license-identifier: 0BSD
 
 import collections
+import collections.abc
 import os
+import re
 
 try:
     from axm.exceptions import (
@@ -29,21 +31,139 @@ cur_sect = sect_fallback
 used_files = [file_fallback]
 used_sect = [sect_fallback]
 
+
+# A dictionary indexed by (filename, sectionname) where more specific
+# file-section pairs inherit what is in the more generic ones. Each
+# file-section pair only stores what was declared for it (its layer).
+# Once inherit() has been run, looking up a file-section pair returns
+# its layer combined with the (filename, common) and (common, common)
+# layers. That combination is only made the first time a file-section
+# pair is looked up, so file-section pairs that are never used don't
+# end up with a copy of everything in the generic layers.
+class OverlayTable(collections.abc.MutableMapping):
+    def __init__(self, factory):
+        # Either dict or list, depending on what is
+        # stored for each file-section pair.
+        self.factory = factory
+        self.reset()
+
+    def reset(self):
+        self._layer_dict = {}
+        # Set by specialize(). Holds every file-section pair
+        # in the table (the values are not used).
+        self._key_dict = None
+        # Set by inherit(). Holds the combined layers.
+        self._flat_dict = None
+
+    def _get_keys(self):
+        if self._key_dict is None:
+            return self._layer_dict
+        return self._key_dict
+
+    # Works the same as the specialize() function, except nothing is
+    # added to the table. It only keeps track of which file-section pairs
+    # should be in the table.
+    def specialize(self, file_section_set, avoid_list):
+        generic_file_set = set()
+        for file_name, section_name in self._layer_dict:
+            if section_name == sect_fallback:
+                generic_file_set.add(file_name)
+        avoid_set = set(avoid_list)
+        key_dict = dict.fromkeys(self._get_keys())
+        for file_section in file_section_set:
+            if file_section in key_dict or file_section in avoid_set:
+                continue
+            # If (common, common) exists, every file-section pair is used.
+            if file_fallback in generic_file_set or file_section[0] in generic_file_set:
+                key_dict[file_section] = None
+        self._key_dict = key_dict
+
+    # Works the same as the inherit() function, except the layers are
+    # only combined once a file-section pair is looked up.
+    def inherit(self):
+        if self._flat_dict is None:
+            self._flat_dict = {}
+
+    def _flatten(self, file_section):
+        file_name, section_name = file_section
+        layer_list = [self._layer_dict.get(file_section)]
+        if file_name != file_fallback and section_name != sect_fallback:
+            layer_list.append(self._layer_dict.get((file_name, sect_fallback)))
+        if file_section != (file_fallback, sect_fallback):
+            layer_list.append(self._layer_dict.get((file_fallback, sect_fallback)))
+        # The layer of the file-section pair itself is kept as it is.
+        flat_val = self.factory(layer_list[0] or ())
+        # The more specific layers come first and
+        # never get overwritten by more generic layers.
+        for layer in layer_list[1:]:
+            if not layer:
+                continue
+            if isinstance(flat_val, dict):
+                for item in layer:
+                    if item not in flat_val:
+                        flat_val[item] = layer[item]
+            else:
+                for item in layer:
+                    if item not in flat_val:
+                        flat_val.append(item)
+        return flat_val
+
+    def __getitem__(self, file_section):
+        if file_section not in self._get_keys():
+            raise KeyError(file_section)
+        if self._flat_dict is None:
+            if file_section not in self._layer_dict:
+                self._layer_dict[file_section] = self.factory()
+            return self._layer_dict[file_section]
+        if file_section not in self._flat_dict:
+            self._flat_dict[file_section] = self._flatten(file_section)
+        return self._flat_dict[file_section]
+
+    def __setitem__(self, file_section, val):
+        if self._key_dict is not None:
+            self._key_dict[file_section] = None
+        if self._flat_dict is None:
+            self._layer_dict[file_section] = val
+        else:
+            self._flat_dict[file_section] = val
+
+    def __delitem__(self, file_section):
+        if file_section not in self._get_keys():
+            raise KeyError(file_section)
+        if self._key_dict is not None:
+            del self._key_dict[file_section]
+        self._layer_dict.pop(file_section, None)
+        if self._flat_dict is not None:
+            self._flat_dict.pop(file_section, None)
+
+    def __contains__(self, file_section):
+        return file_section in self._get_keys()
+
+    def __iter__(self):
+        return iter(list(self._get_keys()))
+
+    def __len__(self):
+        return len(self._get_keys())
+
+    def __repr__(self):
+        return repr(dict(self.items()))
+
+
 ### Default lists and dictionaries used with axm. ###
 
 # Stores all the optional variables for each file and section.
-opt_dict = {}
+opt_dict = OverlayTable(list)
 
 # Maps between the output column name and the possible input column names.
 # Indexed by (filename, sectionname).
-out_input_col = {}
+out_input_col = OverlayTable(dict)
 
 # For each file-section and for every output_column, it stores what text
 # should be printed.
 column_output_dict = {}
 
 # Stores what variables should be removed for each file and section.
-del_dict = {}
+del_dict = OverlayTable(list)
 
 # List of files and sections to avoid
 avoid_list = []
@@ -72,6 +192,77 @@ version_checked = False
 # for each axelor column name inside a file-section pair.
 valid_col_dict = {}
 
+
+# Makes finding an input column among the headers of a section quick.
+# The uppercase form of every header is only made once, exact matches are
+# a dictionary lookup, and substring matches only look at the headers that
+# share the rarest trigram (three character long piece) of what is searched.
+class HeaderIndex:
+    GRAM_LEN = 3
+
+    def __init__(self, header_tuple):
+        self.header_tuple = header_tuple
+        self._upper_list = [str(header).upper() for header in header_tuple]
+        # Maps the uppercase form of a header to the first header with it.
+        self._exact_dict = {}
+        # Maps a trigram to the indexes (in order) of the headers containing it.
+        self._gram_dict = {}
+        for header_index, upper_header in enumerate(self._upper_list):
+            self._exact_dict.setdefault(upper_header, header_tuple[header_index])
+            for gram in self._get_grams(upper_header):
+                gram_list = self._gram_dict.setdefault(gram, [])
+                if not gram_list or gram_list[-1] != header_index:
+                    gram_list.append(header_index)
+        self._find_dict = {}
+
+    @classmethod
+    def _get_grams(cls, text):
+        return [
+            text[start : start + cls.GRAM_LEN]
+            for start in range(len(text) - cls.GRAM_LEN + 1)
+        ]
+
+    def _find_substring(self, needle):
+        if len(needle) < self.GRAM_LEN:
+            header_index_list = range(len(self._upper_list))
+        else:
+            header_index_list = None
+            for gram in self._get_grams(needle):
+                gram_list = self._gram_dict.get(gram)
+                if gram_list is None:
+                    return None
+                if header_index_list is None or len(gram_list) < len(header_index_list):
+                    header_index_list = gram_list
+        for header_index in header_index_list:
+            if needle in self._upper_list[header_index]:
+                return self.header_tuple[header_index]
+        return None
+
+    # Returns the first header that is an exact match for needle (which is
+    # uppercase) or failing that, the first header containing needle.
+    # Returns None if neither is found.
+    def find(self, needle):
+        if needle not in self._find_dict:
+            header = self._exact_dict.get(needle)
+            if header is None:
+                header = self._find_substring(needle)
+            self._find_dict[needle] = header
+        return self._find_dict[needle]
+
+
+# Sections with the same headers share the same index.
+# Cleared by reset(), so it doesn't keep growing in a process
+# doing many conversions (such as a daemon).
+_header_index_dict = {}
+
+
+def get_header_index(headers):
+    header_tuple = tuple(headers)
+    if header_tuple not in _header_index_dict:
+        _header_index_dict[header_tuple] = HeaderIndex(header_tuple)
+    return _header_index_dict[header_tuple]
+
+
 # Adds more specific file-section pairs to list/dictionary if a
 # generic file-section pair is found. For example, if (file, common)
 # is found, (file, super_section) might be added.
@@ -87,6 +278,9 @@ def specialize(table):
     # and not column_output_dict and vice versa.
     set_file_section_source(join_list)
     file_section_set = get_file_section_set()
+    if isinstance(table, OverlayTable):
+        table.specialize(file_section_set, avoid_list)
+        return
     # Since this is a more generic function,
     # need to check whether table is dict or list.
     # If it is a dict, need to know what should be inside it.
@@ -145,6 +339,9 @@ def specialize(table):
 # There are many lists and dictionaries which use the inherit function,
 # hence why it is in common.
 def inherit(table):
+    if isinstance(table, OverlayTable):
+        table.inherit()
+        return
     for file_section in table:
         file_name = file_section[0]
         section_name = file_section[1]
@@ -184,16 +381,26 @@ def inherit(table):
 # file section pairs from multiple sources and places
 # it in a set (so there won't be any duplicates).
 _file_section_set = set()
+# Goes up every time _file_section_set changes, so that
+# the results of get_file_sect() and others like it
+# are thrown away once they might be out of date.
+_file_section_ver = 0
+# How much of the avoid_list has been added to _file_section_set.
+_avoid_list_len = 0
 
 
 def set_file_section_source(*sources):
+    global _file_section_ver
     # Any sources used must be interable.
     for source in sources:
         # Technically, an empty iterable object is still
         # iterable, but for all practical purposes, it is
         # probably not wanted nor expected.
         if hasattr(source, "__iter__") and source:
+            old_len = len(_file_section_set)
             _file_section_set.update(source)
+            if len(_file_section_set) != old_len:
+                _file_section_ver += 1
         else:
             raise AxmSourceNotIterable(source)
 
@@ -202,75 +409,96 @@ def get_file_section_set():
     return _file_section_set
 
 
+# The avoid_list needs to be added to the file_section
+# sources in order to be able to convert the non
+# axm file-section pairs to the axm file-section pairs.
+# That way, everything in the avoid list can be
+# dealt with appropriately. The avoid_list is only ever added
+# to, so only do so if it has grown since the last time.
+def _sync_avoid_list():
+    global _avoid_list_len
+    if len(avoid_list) != _avoid_list_len:
+        set_file_section_source(avoid_list)
+        _avoid_list_len = len(avoid_list)
+
+
+# The file and section names used in the axm file, along with
+# the results of previous lookups. Only valid for _name_index_ver.
+_file_name_index = set()
+_sect_name_index = set()
+_file_name_cache = {}
+_sect_name_cache = {}
+_file_sect_cache = {}
+_name_index_ver = -1
+
+
+def _update_name_index():
+    global _name_index_ver
+    _sync_avoid_list()
+    if _name_index_ver == _file_section_ver:
+        return
+    _file_name_index.clear()
+    _sect_name_index.clear()
+    for axm_file_name, axm_sect_name in _file_section_set:
+        _file_name_index.add(axm_file_name)
+        _sect_name_index.add(axm_sect_name)
+    _file_name_cache.clear()
+    _sect_name_cache.clear()
+    _file_sect_cache.clear()
+    _name_index_ver = _file_section_ver
+
+
 # References to filenames in the axm file
 # might not be an absolute value. It could
 # simply be just the base filename or a relative path.
 def get_file_name(file_name):
-    return_name = ""
-    # The avoid_list needs to be added to the file_section
-    # sources in order to be able to convert the non
-    # axm file-section pairs to the axm file-section pairs.
-    # That way, everything in the avoid list can be
-    # dealt with appropriately. Only do so if the avoid_list
-    # is not empty.
-    if avoid_list:
-        set_file_section_source(avoid_list)
-    file_section_set = get_file_section_set()
-
-    for file_section in file_section_set:
-        axm_file_name = file_section[0]
-        if (
-            file_name == axm_file_name
-            or os.path.abspath(file_name) == axm_file_name
-            or os.path.relpath(file_name) == axm_file_name
-            or os.path.basename(file_name) == axm_file_name
-        ):
-            return_name = axm_file_name
-            break
+    _update_name_index()
+    if file_name not in _file_name_cache:
+        _file_name_cache[file_name] = _find_file_name(file_name)
+    return _file_name_cache[file_name]
+
+
+def _find_file_name(file_name):
+    for axm_file_name in (
+        file_name,
+        os.path.abspath(file_name),
+        os.path.relpath(file_name),
+        os.path.basename(file_name),
+    ):
+        if axm_file_name in _file_name_index:
+            return axm_file_name
     # Test out file_name without file extension.
-    if (file_ext_pos := file_name.rfind(".")) != -1 and not return_name:
-        max_pos = len(file_name) - 1
-        # Don't bother checking for file extension if filename
-        # is one character long or file_ext_pos wasn't found.
-        if max_pos > 0:
-            incr = file_ext_pos
-            tmp_list = list(file_name)
-            tmp_str = ""
-            while incr <= max_pos:
-                del tmp_list[file_ext_pos]
-                incr += 1
-            tmp_str = "".join(tmp_list)
-            return get_file_name(tmp_str)
-    return return_name
+    file_ext_pos = file_name.rfind(".")
+    # Don't bother checking for file extension if filename
+    # is one character long or file_ext_pos wasn't found.
+    if file_ext_pos != -1 and len(file_name) > 1:
+        return get_file_name(file_name[:file_ext_pos])
+    return ""
 
 
 # Sections have to be an exact match (case sensitive).
 # Exceptions are made for whitespace at the beginning and end
 # of section names.
 def get_sect_name(sect_name):
-    return_name = ""
-    file_section_set = get_file_section_set()
-
-    for file_section in file_section_set:
-        axm_sect_name = file_section[1]
-        if sect_name == axm_sect_name:
-            return_name = axm_sect_name
-            break
-    if not return_name:
-        strip_sect_name = sect_name.strip()
-        # Only run the function again if
-        # the strip_sect_name is distinct from
-        # the original sect_name. Helps prevent
-        # an infinite loop.
-        if strip_sect_name != sect_name:
-            return get_sect_name(strip_sect_name)
-    return return_name
+    _update_name_index()
+    if sect_name not in _sect_name_cache:
+        return_name = ""
+        if sect_name in _sect_name_index:
+            return_name = sect_name
+        elif (strip_sect_name := sect_name.strip()) in _sect_name_index:
+            return_name = strip_sect_name
+        _sect_name_cache[sect_name] = return_name
+    return _sect_name_cache[sect_name]
 
 
 # Handles both file and section names, and additionally,
 # checks if the file and section names are in the same
 # tuple.
 def get_file_sect(file_name, section_name):
+    _update_name_index()
+    file_section_key = (file_name, section_name)
+    if file_section_key in _file_sect_cache:
+        return _file_sect_cache[file_section_key]
     axm_file_name = get_file_name(file_name)
     if not axm_file_name:
         axm_file_name = file_fallback
@@ -288,6 +516,7 @@ def get_file_sect(file_name, section_name):
             file_section = (file_fallback, sect_fallback)
         else:
             file_section = None
+    _file_sect_cache[file_section_key] = file_section
     return file_section
 
 
@@ -331,34 +560,24 @@ def find_valid_col():
         # almost always give.
         proper_file_section = get_file_sect(file_name, section_name)
         if proper_file_section in valid_col_dict:
-            valid_input_cols = input_col_dict[file_section]
+            header_index = get_header_index(input_col_dict[file_section])
             # Contains the input columns axm is looking for in a dictionary
             # indexed by output col.
             possible_input_dict = out_input_col[proper_file_section]
-            for output_col in valid_col_dict[proper_file_section]:
+            valid_output_dict = valid_col_dict[proper_file_section]
+            for output_col in valid_output_dict:
+                if valid_output_dict[output_col] is not None:
+                    continue
                 # Do everything starting in terms of possible_input_cols, as the
                 # ordering of that list is canonical.
-                possible_input_cols = possible_input_dict[output_col]
-                for possible_input_col in possible_input_cols:
-                    # First, test all possible input columns for exact input column matches.
-                    # (Keeping in mind that the possible input columns are all caps.)
-                    for valid_input_col in valid_input_cols:
-                        if (
-                            valid_input_col.upper() == possible_input_col
-                            and valid_col_dict[proper_file_section][output_col] is None
-                        ):
-                            valid_col_dict[proper_file_section][
-                                output_col
-                            ] = valid_input_col
-                    # Then, try to find possible_col within input_col.
-                    for valid_input_col in valid_input_cols:
-                        if (
-                            possible_input_col in valid_input_col.upper()
-                            and valid_col_dict[proper_file_section][output_col] is None
-                        ):
-                            valid_col_dict[proper_file_section][
-                                output_col
-                            ] = valid_input_col
+                # For each possible input column, an exact match is tried first,
+                # then a header containing the possible input column.
+                # (Keeping in mind that the possible input columns are all caps.)
+                for possible_input_col in possible_input_dict[output_col]:
+                    valid_input_col = header_index.find(possible_input_col)
+                    if valid_input_col is not None:
+                        valid_output_dict[output_col] = valid_input_col
+                        break
 
 
 # Remove all file-section pairs and variables that
@@ -420,11 +639,6 @@ def check_valid_col():
         raise AxmExpectedVarNotFound(missing_map_dict)
 
 
-scheduler.add(prep_valid_col_dict, scheduler.NICE_VALID_COL)
-scheduler.add(find_valid_col, scheduler.NICE_VALID_COL)
-scheduler.add(purge_valid_col, scheduler.NICE_VALID_COL)
-scheduler.add(check_valid_col, scheduler.NICE_VALID_COL)
-
 INPUT_COL_VAR = "$input_col"
 OUTPUT_COL_VAR = "$output_col"
 INPUT_TXT_VAR = "$input_txt"
@@ -447,4 +661,155 @@ def set_output():
                 column_output_dict[file_section][output_col] = OUTPUT_TXT_VAR
 
 
-scheduler.add(set_output, scheduler.NICE_OUT_STRING)
+# The output strings in column_output_dict only have $input_txt and
+# $output_txt left in them once set_output() is done. Each one gets split
+# into the text around those variables, so that output.string() can put
+# the output together without searching through the string for every cell.
+# Output strings that are just one of the variables (or none of them)
+# get their own kind, so that nothing needs to be put together for them.
+OUT_LITERAL = "literal"
+OUT_INPUT_TXT = "input_txt"
+OUT_OUTPUT_TXT = "output_txt"
+OUT_MIXED = "mixed"
+
+# parts has the text around the variables, with None in place of the
+# variables. input_pos and output_pos contain the indexes in parts where
+# $input_txt and $output_txt go.
+CompiledOutput = collections.namedtuple(
+    "CompiledOutput", ("kind", "parts", "input_pos", "output_pos")
+)
+
+_output_var_re = re.compile(
+    "(" + re.escape(INPUT_TXT_VAR) + "|" + re.escape(OUTPUT_TXT_VAR) + ")"
+)
+
+# Same layout as column_output_dict, but with CompiledOutput values.
+compiled_output_dict = {}
+
+
+def compile_output_str(out_str):
+    if out_str == INPUT_TXT_VAR:
+        return CompiledOutput(OUT_INPUT_TXT, (), (), ())
+    if out_str == OUTPUT_TXT_VAR:
+        return CompiledOutput(OUT_OUTPUT_TXT, (), (), ())
+    part_list = []
+    input_pos_list = []
+    output_pos_list = []
+    for part in _output_var_re.split(out_str):
+        if part == INPUT_TXT_VAR:
+            input_pos_list.append(len(part_list))
+            part_list.append(None)
+        elif part == OUTPUT_TXT_VAR:
+            output_pos_list.append(len(part_list))
+            part_list.append(None)
+        elif part:
+            part_list.append(part)
+    if not (input_pos_list or output_pos_list):
+        return CompiledOutput(OUT_LITERAL, (out_str,), (), ())
+    return CompiledOutput(
+        OUT_MIXED, tuple(part_list), tuple(input_pos_list), tuple(output_pos_list)
+    )
+
+
+def compile_output():
+    compiled_output_dict.clear()
+    for file_section in column_output_dict:
+        compiled_output_dict[file_section] = {
+            output_col: compile_output_str(out_str)
+            for output_col, out_str in column_output_dict[file_section].items()
+        }
+
+
+# Returns everything that output.py needs once parser.finalize() is done,
+# so that the result of parsing and finalizing can be stored elsewhere.
+def export_state():
+    # OverlayTable is converted into a regular dictionary
+    # (with every file-section pair already combined).
+    return {
+        "out_input_col": dict(out_input_col.items()),
+        "column_output_dict": column_output_dict,
+        "valid_col_dict": valid_col_dict,
+        "opt_dict": dict(opt_dict.items()),
+        "avoid_list": avoid_list,
+        "file_section_set": _file_section_set,
+    }
+
+
+# The opposite of export_state(). The tables are updated
+# in place, as the scheduler holds references to them.
+def import_state(state_dict):
+    out_input_col.update(state_dict["out_input_col"])
+    column_output_dict.update(state_dict["column_output_dict"])
+    valid_col_dict.update(state_dict["valid_col_dict"])
+    opt_dict.update(state_dict["opt_dict"])
+    avoid_list.extend(state_dict["avoid_list"])
+    if state_dict["file_section_set"]:
+        set_file_section_source(state_dict["file_section_set"])
+    compile_output()
+
+
+# Throws away everything from the last axm file (and the input
+# columns it was used with) so that another one can be used.
+def reset():
+    global cur_file
+    global cur_sect
+    global used_files
+    global used_sect
+    global opt_dict
+    global out_input_col
+    global column_output_dict
+    global del_dict
+    global avoid_list
+    global input_col_dict
+    global version_checked
+    global valid_col_dict
+    global _file_section_set
+    global _file_section_ver
+    global _avoid_list_len
+    global _file_name_index
+    global _sect_name_index
+    global _file_name_cache
+    global _sect_name_cache
+    global _file_sect_cache
+    global _name_index_ver
+    global compiled_output_dict
+    global _header_index_dict
+
+    cur_file = file_fallback
+    cur_sect = sect_fallback
+    used_files = [file_fallback]
+    used_sect = [sect_fallback]
+    # New objects are used instead of clearing the old ones,
+    # as the old ones might still be used somewhere else
+    # (see conversion.py).
+    opt_dict = OverlayTable(list)
+    out_input_col = OverlayTable(dict)
+    column_output_dict = {}
+    del_dict = OverlayTable(list)
+    avoid_list = []
+    input_col_dict = {}
+    version_checked = False
+    valid_col_dict = {}
+    _file_section_set = set()
+    _file_section_ver = 0
+    _avoid_list_len = 0
+    _file_name_index = set()
+    _sect_name_index = set()
+    _file_name_cache = {}
+    _sect_name_cache = {}
+    _file_sect_cache = {}
+    _name_index_ver = -1
+    compiled_output_dict = {}
+    _header_index_dict = {}
+
+
+# Adds the steps defined here to the scheduler. It isn't done
+# when the module is imported, so parser.schedule() decides
+# when (and whether) it happens.
+def schedule():
+    scheduler.add(prep_valid_col_dict, scheduler.NICE_VALID_COL)
+    scheduler.add(find_valid_col, scheduler.NICE_VALID_COL)
+    scheduler.add(purge_valid_col, scheduler.NICE_VALID_COL)
+    scheduler.add(check_valid_col, scheduler.NICE_VALID_COL)
+    scheduler.add(set_output, scheduler.NICE_OUT_STRING)
+    scheduler.add(compile_output, scheduler.NICE_OUT_STRING)
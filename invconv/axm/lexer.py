@@ -0,0 +1,66 @@
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+# Splits the text of an axm file into tokens, so that the
+# parser knows what each line is without having to try out
+# every command and operator on it.
+
+import collections
+
+try:
+    import axm.command as command
+    import axm.operator as operator
+except ModuleNotFoundError:
+    import invconv.axm.command as command
+    import invconv.axm.operator as operator
+
+# The type of a token is one of the TOKEN_* constants, while
+# name is the name of the command or operator (None for comments).
+# text contains the line the token was found in (minus any comment)
+# or the text of the comment.
+Token = collections.namedtuple("Token", ("type", "name", "text", "line_num"))
+
+TOKEN_COMMAND = "command"
+TOKEN_OPERATOR = "operator"
+TOKEN_COMMENT = "comment"
+
+COMMENT_PREFIX = "#"
+
+
+# Gets the name of the command at the beginning of a line.
+# A command doesn't have to be followed by whitespace
+# (for example, "!SECT[FILE: My File]"), so the name ends
+# at the first character that can't be part of it.
+def get_command_name(line):
+    name_list = []
+    for char in line.removeprefix(command.COMMAND_PREFIX):
+        if not (char.isalnum() or char == "_"):
+            break
+        name_list.append(char)
+    return "".join(name_list)
+
+
+# Goes through the text once and returns a list of tokens.
+# Blank lines don't result in any tokens.
+def tokenize(text):
+    token_list = []
+    for line_num, line in enumerate(text.splitlines(), 1):
+        line = line.strip()
+        if COMMENT_PREFIX in line:
+            line, comment = line.split(COMMENT_PREFIX, 1)
+            line = line.strip()
+            token_list.append(Token(TOKEN_COMMENT, None, comment.strip(), line_num))
+        if not line:
+            continue
+        if line.startswith(command.COMMAND_PREFIX):
+            token_list.append(
+                Token(TOKEN_COMMAND, get_command_name(line), line, line_num)
+            )
+        else:
+            # Checking whether an operator actually exists
+            # is left to the parser, as it knows which line it
+            # is parsing when raising an exception.
+            token_list.append(
+                Token(TOKEN_OPERATOR, operator.lfind_name(line), line, line_num)
+            )
+    return token_list
@@ -1,6 +1,7 @@
 # Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
 # SPDX-license-identifier: 0BSD
 
+import re
 import string
 import types
 
@@ -31,35 +32,15 @@ class OperStruct:
 
     def _default_find_func(self, line):
         symbol = self.symbol
-        return_val = -1
-        if symbol in line:
-            symbol_len = len(symbol)
-            symbol_start = line.find(symbol)
-            if symbol_len == 0:
-                # Likely would be a mistake.
-                return_val = -1
-            # Some operators use quotes.
-            elif '"' in line:
-                # If an operator is beyond a quotation
-                # mark, then likely it wasn't meant
-                # to be an operator and is just part
-                # of a string.
-                if line.find('"') > symbol_start:
-                    return_val = symbol_start
-                else:
-                    return_val = -1
-            elif symbol_len == 1:
-                # Need to confirm operator is by itself.
-                if is_single(line, symbol_start):
-                    return_val = symbol_start
-            else:
-                # Ensure that this longer operator
-                # is not just part of an even larger operator.
-                symbol_end = symbol_start + symbol_len
-                after_symbol = symbol_end + 1
-                if not line[after_symbol] in string.punctuation:
-                    return_val = symbol_start
-        return return_val
+        # An empty symbol would likely be a mistake.
+        if not symbol:
+            return -1
+        symbol_start = line.find(symbol)
+        while symbol_start > -1:
+            if is_valid_pos(line, symbol, symbol_start):
+                return symbol_start
+            symbol_start = line.find(symbol, symbol_start + 1)
+        return -1
 
     def _default_parse_func(self, line):
         symbol = self.symbol
@@ -93,6 +74,9 @@ class OperStruct:
         default_action_func = self._default_action_func
         self.symbol = symbol
         self.find_func = self._catch_invalid(find_func, default_find_func)
+        # The symbol pattern used by lfind_name() already does
+        # the same thing as the default find_func.
+        self.has_default_find = self.find_func == default_find_func
         self.parse_func = self._catch_invalid(parse_func, default_parse_func)
         self.base_action_func = self._catch_invalid(
             base_action_func, default_action_func
@@ -110,14 +94,42 @@ class OperStruct:
 _oper_dict = {}
 ALL_OPERATORS = "*"
 
+# Contains the names of the operators using each symbol
+# (in the order they were added).
+_symbol_dict = {}
+# Longer symbols come first so that they are tried before
+# any shorter symbols they start with.
+_symbol_list = []
+# A pattern that matches at every position where any
+# symbol starts. It is rebuilt whenever an operator is added.
+_symbol_pattern = None
+
+
+def _compile_symbols():
+    global _symbol_list
+    global _symbol_pattern
+    _symbol_list = sorted(
+        [symbol for symbol in _symbol_dict if symbol], key=len, reverse=True
+    )
+    if not _symbol_list:
+        _symbol_pattern = None
+        return
+    # A lookahead is used so that matches can overlap.
+    escaped_list = [re.escape(symbol) for symbol in _symbol_list]
+    _symbol_pattern = re.compile("(?=(" + "|".join(escaped_list) + "))")
+
 
 def add(name, symbol, find_func=None, parse_func=None, action_func=None):
     global _oper_dict
     if name == ALL_OPERATORS:
-        raise AxmInvalidName
+        raise AxmInvalidName(name)
     if name in _oper_dict:
-        raise AxmNameExists
+        raise AxmNameExists(name)
     _oper_dict[name] = OperStruct(symbol, find_func, parse_func, action_func)
+    if symbol not in _symbol_dict:
+        _symbol_dict[symbol] = []
+    _symbol_dict[symbol].append(name)
+    _compile_symbols()
 
 
 def get(name):
@@ -128,14 +140,25 @@ def get(name):
     return None
 
 
+# Describes every operator that has been added, by its name, symbol
+# and functions. Map files parsed with different operators give
+# different results, which is why this is part of the cache key.
+def get_signature():
+    return [
+        (name, oper.symbol)
+        + tuple(
+            utils.get_func_name(func)
+            for func in (oper.find_func, oper.parse_func, oper.base_action_func)
+        )
+        for name, oper in _oper_dict.items()
+    ]
+
+
 # Could find if a name exists, but
 # finding if a symbol already exists is more
 # accurate.
 def symbol_exists(symbol):
-    for name_tuple in _oper_dict.items():
-        if symbol == name_tuple[1].symbol:
-            return True
-    return False
+    return symbol in _symbol_dict
 
 
 # Returns True if only one character is used
@@ -144,6 +167,10 @@ def is_single(line, oper_loc):
     pre_oper_loc = oper_loc - 1
     post_oper_loc = oper_loc + 1
 
+    # There is nothing for the operator to be
+    # a part of at the beginning or end of a line.
+    if pre_oper_loc < 0 or post_oper_loc >= len(line):
+        return True
     if not (
         line[pre_oper_loc] in string.punctuation
         and line[post_oper_loc] in string.punctuation
@@ -152,20 +179,68 @@ def is_single(line, oper_loc):
     return False
 
 
+# Checks whether a symbol found at symbol_start
+# is actually being used as an operator.
+def is_valid_pos(line, symbol, symbol_start):
+    symbol_len = len(symbol)
+    # Some operators use quotes.
+    if '"' in line:
+        # If an operator is beyond a quotation
+        # mark, then likely it wasn't meant
+        # to be an operator and is just part
+        # of a string.
+        return line.find('"') > symbol_start
+    if symbol_len == 1:
+        # Need to confirm operator is by itself.
+        return is_single(line, symbol_start)
+    # Ensure that this longer operator
+    # is not just part of an even larger operator.
+    symbol_end = symbol_start + symbol_len
+    return symbol_end >= len(line) or line[symbol_end] not in string.punctuation
+
+
+# Yields the name of every operator used in a given string, in
+# the order they appear in it. All symbols are looked for at the
+# same time, so the number of operators doesn't matter much.
+def _iter_names(line):
+    if _symbol_pattern is None:
+        return
+    # Operators with their own find_func are only
+    # asked once where they think they are.
+    custom_pos_dict = {}
+    for symbol_match in _symbol_pattern.finditer(line):
+        symbol_start = symbol_match.start()
+        for symbol in _symbol_list:
+            if not line.startswith(symbol, symbol_start):
+                continue
+            for oper_name in _symbol_dict[symbol]:
+                oper = _oper_dict[oper_name]
+                if oper.has_default_find:
+                    if is_valid_pos(line, symbol, symbol_start):
+                        yield oper_name
+                else:
+                    if oper_name not in custom_pos_dict:
+                        custom_pos_dict[oper_name] = oper.find_func(line)
+                    if custom_pos_dict[oper_name] == symbol_start:
+                        yield oper_name
+
+
+# Returns the name of the first operator in a given string
+# or None if no operator can be found.
+def lfind_name(line):
+    return next(_iter_names(line), None)
+
+
+# Returns the names of all operators used in a given string,
+# in the order the operators were added.
+def find_names(line):
+    name_set = set(_iter_names(line))
+    return [oper_name for oper_name in _oper_dict if oper_name in name_set]
+
+
 # Return the first operator in a given string.
 def lfind(line):
-    first_pos = None
-    first_name = None
-    for oper_name in _oper_dict:
-        oper_pos = _oper_dict[oper_name].find_func(line)
-        if oper_pos > -1:
-            if first_pos is None:
-                first_pos = oper_pos
-            if first_name is None:
-                first_name = oper_name
-            if oper_pos > first_pos:
-                first_pos = oper_pos
-                first_name = oper_name
+    first_name = lfind_name(line)
     if first_name is not None:
         return _oper_dict[first_name]
     return None
@@ -199,15 +274,9 @@ def _act_opt(line, parse_func):
     # use _default_parse_function.
     # No other parser is currently supported.
     # Result ends up in output_col.
-    search_for_opers = True
-    while search_for_opers:
-        tuple_or_none = lfind(parsed_str)
-        if tuple_or_none is not None:
-            output_col = tuple_or_none.parse_func(parsed_str)[0]
-            # Operator has been found and output_col is now presumably by
-            # itself (without any operators present). Therefore, the
-            # search for operators is at an end.
-            search_for_opers = False
+    tuple_or_none = lfind(parsed_str)
+    if tuple_or_none is not None:
+        output_col = tuple_or_none.parse_func(parsed_str)[0]
     if (common.cur_file, common.cur_sect) not in common.opt_dict:
         common.opt_dict[(common.cur_file, common.cur_sect)] = []
     common.opt_dict[(common.cur_file, common.cur_sect)].append(output_col)
@@ -225,8 +294,6 @@ if not symbol_exists(_OPT_SYMBOL):
         parse_func=_parse_opt,
         action_func=_act_opt,
     )
-    scheduler.add(common.specialize, scheduler.NICE_INHERIT, [common.opt_dict])
-    scheduler.add(common.inherit, scheduler.NICE_INHERIT, [common.opt_dict])
 
 
 _ASSIGN_SYMBOL = ":"
@@ -322,5 +389,10 @@ if not symbol_exists(_IMPORTER_SYMBOL):
     )
 
 
-scheduler.add(common.specialize, scheduler.NICE_INHERIT, [common.out_input_col])
-scheduler.add(common.inherit, scheduler.NICE_INHERIT, [common.out_input_col])
+# Adds the steps needed by the optional operator and the
+# operators filling out_input_col to the scheduler.
+def schedule():
+    scheduler.add(common.specialize, scheduler.NICE_INHERIT, [common.opt_dict])
+    scheduler.add(common.inherit, scheduler.NICE_INHERIT, [common.opt_dict])
+    scheduler.add(common.specialize, scheduler.NICE_INHERIT, [common.out_input_col])
+    scheduler.add(common.inherit, scheduler.NICE_INHERIT, [common.out_input_col])
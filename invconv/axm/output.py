@@ -16,11 +16,24 @@ def get_func(outcol):
     return _FUNCTION_MAP[outcol]
 
 
+# Returns every function that has been set, indexed by output column.
+def get_funcs():
+    return dict(_FUNCTION_MAP)
+
+
 def set_func(outcol, incol):
     global _FUNCTION_MAP
     _FUNCTION_MAP[outcol] = incol
 
 
+# Gives the next conversion its own copy of the functions, so that
+# functions it sets don't end up being used by other conversions.
+# Functions set before then (such as the built-in ones) are kept.
+def reset():
+    global _FUNCTION_MAP
+    _FUNCTION_MAP = dict(_FUNCTION_MAP)
+
+
 # Checks if the input column name matches the valid
 # input column for a given output column. If the valid input
 # column is None or non-existant, the function always returns True,
@@ -57,27 +70,55 @@ def string(file_section, output_col, input_txt):
     # Need to conform the file-section name sheme used internally in the script
     # to the scheme used by the AXM file.
     proper_file_section = common.get_file_sect(file_section[0], file_section[1])
-    out_str = ""
     # If the file section and/or output column is missing, something must have been deleted or avoided.
     # In that case, it will attempt passing an empty quote to output_func in the hopes of
     # getting some fallback value.
-    if (
-        proper_file_section in common.column_output_dict
-        and output_col in common.column_output_dict[proper_file_section]
+    compiled_output = common.compiled_output_dict.get(proper_file_section, {}).get(
+        output_col
+    )
+    if compiled_output is None:
+        if output_func is not None:
+            return output_func("")
+        return ""
+    kind = compiled_output.kind
+    if common.OUTPUT_TXT_VAR in input_txt and (
+        kind == common.OUT_INPUT_TXT or compiled_output.input_pos
     ):
-        out_str = common.column_output_dict[proper_file_section][output_col]
-        out_str = out_str.replace(common.INPUT_TXT_VAR, input_txt)
-        # Try to pass the input_txt to output_func to get the proper output.
-        # If a function is not provided, fallback to input text so that no
-        # content is lost.
-        if common.OUTPUT_TXT_VAR in out_str:
-            if output_func is not None:
-                out_str = out_str.replace(
-                    common.OUTPUT_TXT_VAR, str(output_func(input_txt))
-                )
-            else:
-                out_str = out_str.replace(common.OUTPUT_TXT_VAR, input_txt)
-    else:
+        return _replace_vars(
+            common.column_output_dict[proper_file_section][output_col],
+            output_func,
+            input_txt,
+        )
+    # Try to pass the input_txt to output_func to get the proper output.
+    # If a function is not provided, fallback to input text so that no
+    # content is lost.
+    if kind == common.OUT_OUTPUT_TXT:
+        if output_func is not None:
+            return str(output_func(input_txt))
+        return input_txt
+    if kind == common.OUT_INPUT_TXT:
+        return input_txt
+    if kind == common.OUT_LITERAL:
+        return compiled_output.parts[0]
+    part_list = list(compiled_output.parts)
+    for input_pos in compiled_output.input_pos:
+        part_list[input_pos] = input_txt
+    if compiled_output.output_pos:
+        output_txt = input_txt
+        if output_func is not None:
+            output_txt = str(output_func(input_txt))
+        for output_pos in compiled_output.output_pos:
+            part_list[output_pos] = output_txt
+    return "".join(part_list)
+
+
+# Puts the output string together the way it was done before it was
+# compiled. $input_txt gets replaced first, so $output_txt found in the
+# input text itself gets replaced as well. Only used when that happens.
+def _replace_vars(out_str, output_func, input_txt):
+    out_str = out_str.replace(common.INPUT_TXT_VAR, input_txt)
+    if common.OUTPUT_TXT_VAR in out_str:
         if output_func is not None:
-            out_str = output_func("")
+            return out_str.replace(common.OUTPUT_TXT_VAR, str(output_func(input_txt)))
+        return out_str.replace(common.OUTPUT_TXT_VAR, input_txt)
     return out_str
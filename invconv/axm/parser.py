@@ -4,78 +4,121 @@
 try:
     import axm.common as common
     import axm.command as command
-    from axm.exceptions import AxmOperatorNotFound
+    from axm.exceptions import AxmCommandNotRecognized, AxmOperatorNotFound
+    import axm.lexer as lexer
     import axm.operator as operator
     import axm.scheduler as scheduler
-    import axm.utils as utils
 except ModuleNotFoundError:
     import invconv.axm.common as common
     import invconv.axm.command as command
-    from invconv.axm.exceptions import AxmOperatorNotFound
+    from invconv.axm.exceptions import AxmCommandNotRecognized, AxmOperatorNotFound
+    import invconv.axm.lexer as lexer
     import invconv.axm.operator as operator
     import invconv.axm.scheduler as scheduler
-    import invconv.axm.utils as utils
+
+# The built-in steps of finalize() only need to
+# be added to the scheduler once.
+_is_scheduled = False
+
+
+# Adds the built-in steps of finalize() to the scheduler.
+# This is done by init(), but it can be run earlier in
+# order to rearrange the steps before parsing.
+def schedule():
+    global _is_scheduled
+    if _is_scheduled:
+        return
+    command.schedule()
+    operator.schedule()
+    common.schedule()
+    _is_scheduled = True
+
+
+# Forgets that the built-in steps have been added to the scheduler,
+# so that they get added again once scheduler.reset() has been run.
+def reset():
+    global _is_scheduled
+    _is_scheduled = False
+
 
 # Copies a list of input columns for later processing.
 def init(input_col):
     common.input_col_dict = input_col
+    schedule()
 
 
-def parse(axm_fptr):
-    # Convert the new line char to a space to that it will be removed
-    # when the whitespace at the beginning and at the end of the string
-    # is stripped.
-    line = axm_fptr.readline().replace("\n", " ").strip()
-    if "#" in line:
-        line = utils.split_n_strip(line, "#")
-        # If the entire line is a comment,
-        # split_n_strip() will return an
-        # empty string in the first position
-        # of the list. Otherwise, the first position
-        # will just be the text without the comment.
-        line = line[0]
-    # Guards against blank lines and commented lines.
-    if line:
-        if command.verify(line):
-            for command_type in command.get(command.ALL_COMMANDS):
-                if command_type.check_func(line):
-                    # All action functions for every
-                    # command must remove the command prefix
-                    # itself. For example, "!AXM 3.0" will
-                    # be passed as such to action_func.
-                    # It won't be stripped down to "3.0".
-                    command_type.action_func(line)
+# Every type of token has its own function to deal with it.
+def _parse_command(token):
+    command_type = command.get(token.name)
+    # Command names are case sensitive, while command.get() is not.
+    if command_type is None or command_type.name != token.name:
+        # Same as command.verify(), the name of the command is given
+        # if it can be found. Otherwise, the whole line is given.
+        command_name = token.text
+        if (whitespace_pos := command_name.find(" ")) != -1:
+            command_name = command_name[:whitespace_pos]
         else:
-            # The reason a for loop isn't used is so all operators
-            # can be looked at again. An operator should be expected
-            # to be found at least once, as commands are already dealt
-            # with and blank/commented lines are ignored, making
-            # operators the only logical choice for existance in a
-            # line.
-            is_oper_found = False
-            oper_list = operator.get(operator.ALL_OPERATORS)
+            command_name = f'"{command_name}"'
+        raise AxmCommandNotRecognized(command_name)
+    if command_type.check_func(token.text):
+        # All action functions for every
+        # command must remove the command prefix
+        # itself. For example, "!AXM 3.0" will
+        # be passed as such to action_func.
+        # It won't be stripped down to "3.0".
+        command_type.action_func(token.text)
+
+
+# Every operator used in the line is acted upon, in the
+# order the operators were added. An operator should be
+# expected to be found at least once, as commands are dealt
+# with by the lexer and blank/commented lines are dropped,
+# making operators the only logical choice for existance
+# in a line.
+def _parse_operator(token):
+    line = token.text
+    oper_name_list = operator.find_names(line)
+    if not oper_name_list:
+        raise AxmOperatorNotFound(line)
+    index = 0
+    while index < len(oper_name_list):
+        oper = operator.get(oper_name_list[index])
+        index += 1
+        # Action functions only return values
+        # to overwrite the currently used line.
+        return_val = oper.action_func(line)
+        if return_val is not None:
+            line = return_val
+            # Start over so that all operators
+            # are looked at again.
+            oper_name_list = operator.find_names(line)
             index = 0
-            oper_max_pos = len(oper_list) - 1
-            while index <= oper_max_pos:
-                oper = oper_list[index]
-                index += 1
-                if oper.find_func(line) > -1:
-                    is_oper_found = True
-                    # Action functions only return values
-                    # to overwrite the currently used line.
-                    return_val = oper.action_func(line)
-                    if return_val is not None:
-                        line = return_val
-                        # Reset incr so that all operators
-                        # are looked at again.
-                        index = 0
-            if not is_oper_found:
-                raise AxmOperatorNotFound(line)
+
+
+def _parse_comment(token):
+    pass
+
+
+_token_dispatch = {
+    lexer.TOKEN_COMMAND: _parse_command,
+    lexer.TOKEN_OPERATOR: _parse_operator,
+    lexer.TOKEN_COMMENT: _parse_comment,
+}
+
+
+# Parses everything remaining in axm_fptr. The whole file is
+# split into tokens first, and then each token is handed to the
+# function dealing with its type.
+def parse(axm_fptr):
+    for token in lexer.tokenize(axm_fptr.read()):
+        _token_dispatch[token.type](token)
 
 
 # Processes all the things that need to be processed.
 def finalize():
     func_deque = scheduler.get(scheduler.ALL_SCHEDULED)
+    if func_deque is None:
+        return
     func_deque_len = len(func_deque)
     incr = 0
     while incr < func_deque_len:
@@ -64,6 +64,11 @@ def is_eof(axm_fptr):
     return False
 
 
+def reset():
+    global stream_pos
+    stream_pos = None
+
+
 def reset_eof(axm_fptr):
     global stream_pos
     stream_pos = None
@@ -92,3 +97,13 @@ def split_n_strip(string, sep):
         # Need to add all the text after the last seperator.
         split_list.append("".join(tmp_list).strip())
     return split_list
+
+
+# Returns the module and name of func (such as
+# "axm.operator._act_opt"), which tells functions apart
+# without having to compare the functions themselves.
+def get_func_name(func):
+    return (
+        f"{getattr(func, '__module__', None)}."
+        f"{getattr(func, '__qualname__', type(func).__name__)}"
+    )
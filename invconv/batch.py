@@ -0,0 +1,216 @@
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+# Runs many conversions (jobs) listed in a manifest in one go. The
+# manifest is a JSON or TOML file with a list of jobs and, optionally,
+# defaults used by every job:
+#
+#   [defaults]
+#   map_file = "default.axm"
+#   data_file = "demo.ini"
+#
+#   [[jobs]]
+#   name = "supplier-a"
+#   inputs = ["supplier-a.xlsx"]
+#   output = "out/supplier-a.csv"
+#   fallback = {axelor_units = "Unit"}
+#
+# Relative paths are relative to the manifest. Jobs are handed out to a
+# pool of worker processes. Every worker keeps the data files and maps
+# it has loaded in memory (see cache.keep_in_memory), so jobs sharing
+# them only load them once per worker (and once overall when cached).
+
+import collections
+import concurrent.futures
+import json
+import os
+import time
+
+from loguru import logger
+
+try:
+    import cache
+    import conversion
+    from exceptions import InvconvArgumentError
+    import msg_handler
+    import sink
+except ModuleNotFoundError:
+    import invconv.cache as cache
+    import invconv.conversion as conversion
+    from invconv.exceptions import InvconvArgumentError
+    import invconv.msg_handler as msg_handler
+    import invconv.sink as sink
+
+JOB_KEYS = (
+    "name",
+    "inputs",
+    "output",
+    "map_file",
+    "data_file",
+    "file_type",
+    "fallback",
+)
+Job = collections.namedtuple("Job", JOB_KEYS)
+JobResult = collections.namedtuple(
+    "JobResult", ("name", "output", "rows", "warnings", "seconds", "error", "log_list")
+)
+
+JOB_DEFAULTS = {
+    "output": ".",
+    "map_file": "default.axm",
+    "data_file": "demo.ini",
+    "file_type": None,
+    "fallback": None,
+}
+
+
+def _read_manifest(manifest_path):
+    if manifest_path.endswith(".toml"):
+        try:
+            import tomllib
+        except ModuleNotFoundError:
+            # tomllib is only included with Python 3.11 and later.
+            try:
+                import tomli as tomllib
+            except ModuleNotFoundError:
+                logger.log(
+                    "FAILURE", "Reading TOML manifests needs Python 3.11+ or tomli."
+                )
+                raise InvconvArgumentError
+        with open(manifest_path, "rb") as manifest_fptr:
+            return tomllib.load(manifest_fptr)
+    with open(manifest_path) as manifest_fptr:
+        return json.load(manifest_fptr)
+
+
+def load_manifest(manifest_path):
+    manifest_dict = _read_manifest(manifest_path)
+    manifest_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+    def get_path(path):
+        return os.path.normpath(os.path.join(manifest_dir, os.path.expanduser(path)))
+
+    default_dict = dict(JOB_DEFAULTS)
+    default_dict.update(manifest_dict.get("defaults", {}))
+    job_list = []
+    for job_num, job_dict in enumerate(manifest_dict.get("jobs", []), 1):
+        job_dict = {**default_dict, **job_dict}
+        unknown_keys = set(job_dict) - set(JOB_KEYS)
+        if unknown_keys or not job_dict.get("inputs"):
+            logger.log(
+                "FAILURE",
+                f"Job {job_num} in {manifest_path} has no inputs or unknown keys "
+                f"({', '.join(sorted(unknown_keys))}).",
+            )
+            raise InvconvArgumentError
+        job_dict.setdefault("name", f"job-{job_num}")
+        job_dict["inputs"] = [get_path(input_file) for input_file in job_dict["inputs"]]
+        for path_key in ("output", "map_file", "data_file"):
+            job_dict[path_key] = get_path(job_dict[path_key])
+        job_list.append(Job(**job_dict))
+    return job_list
+
+
+# Messages logged by the current job in a worker process.
+_log_list = []
+
+
+def _init_worker(use_cache, error_policy):
+    cache.is_enabled = use_cache
+    msg_handler.error_policy = error_policy
+    cache.keep_in_memory = True
+    # Messages are sent back with the result, so that
+    # they end up in the log of the main process.
+    msg_handler.capture_log(_log_list.append)
+
+
+# The job holds conversion.lock throughout, so that nothing else
+# converting in this process logs warnings while they are counted.
+def run_job(job):
+    with conversion.lock:
+        return _run_job(job)
+
+
+def _run_job(job):
+    _log_list.clear()
+    num_warnings = 0
+
+    # Warnings that were left out (see msg_handler.warn())
+    # still count.
+    def count_warning(message):
+        nonlocal num_warnings
+        num_warnings += message.record["extra"].get("num_hidden", 1)
+
+    warning_id = logger.add(
+        count_warning, filter=lambda record: record["level"].name == "WARNING"
+    )
+    start_time = time.perf_counter()
+    output_path = job.output
+    num_rows = 0
+    error = None
+    try:
+        job_conversion = conversion.Conversion(
+            job.inputs,
+            map_file=job.map_file,
+            data_file=job.data_file,
+            file_type=job.file_type,
+            fallback_dict=job.fallback,
+            use_cache=cache.is_enabled,
+        )
+        job_conversion.start()
+        output_path = sink.get_output_path(job.output, job_conversion.csv_type)
+        with sink.CsvSink(output_path) as output_sink:
+            output_sink.write_row(job_conversion.columns)
+            for row in job_conversion.rows():
+                output_sink.write_row(row)
+                num_rows += 1
+    except Exception as job_error:
+        error = str(job_error) or type(job_error).__name__
+        logger.opt(exception=job_error).log("FAILURE", f"Job {job.name} failed.")
+    finally:
+        logger.remove(warning_id)
+    return JobResult(
+        job.name,
+        output_path,
+        num_rows,
+        num_warnings,
+        time.perf_counter() - start_time,
+        error,
+        list(_log_list),
+    )
+
+
+# Runs every job with num_workers processes and returns the results
+# in the same order as job_list. Messages logged by the jobs are
+# logged again here, one job after the other. With a single worker,
+# the jobs are run in this process instead.
+def run(job_list, num_workers=1, use_cache=True):
+    if num_workers <= 1:
+        cache.is_enabled = use_cache
+        cache.keep_in_memory = True
+        return [run_job(job) for job in job_list]
+    result_list = []
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=num_workers,
+        mp_context=msg_handler.get_worker_context(),
+        initializer=_init_worker,
+        initargs=(use_cache, msg_handler.get_error_policy()),
+    ) as executor:
+        for job_result in executor.map(run_job, job_list):
+            for log_entry in job_result.log_list:
+                msg_handler.replay_log(*log_entry)
+            result_list.append(job_result._replace(log_list=[]))
+    return result_list
+
+
+def get_summary(result_list):
+    line_list = [f"{'JOB':<24} {'ROWS':>8} {'WARNINGS':>8} {'SECONDS':>8}  RESULT"]
+    for job_result in result_list:
+        status = job_result.output
+        if job_result.error is not None:
+            status = f"FAILED: {job_result.error}"
+        line_list.append(
+            f"{job_result.name:<24} {job_result.rows:>8} {job_result.warnings:>8} "
+            f"{job_result.seconds:>8.3f}  {status}"
+        )
+    return "\n".join(line_list)
@@ -0,0 +1,527 @@
+#!/usr/bin/env python3
+
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+"""Checks the axm package and the row record directly, without converting anything."""
+
+import argparse
+import io
+import os
+import random
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import axm
+import common
+
+# Every check, in the order they are run.
+_check_list = []
+
+
+def check(check_func):
+    _check_list.append(check_func)
+    return check_func
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def expect(what, actual, expected):
+    if actual != expected:
+        raise CheckFailed(f"{what}: got {actual!r}, expected {expected!r}")
+
+
+# Sets up a single file-section pair with the given output strings,
+# the same way parser.finalize() would have left it.
+def _set_output_strings(file_section, out_str_dict):
+    axm.common.set_file_section_source([file_section])
+    axm.common.column_output_dict[file_section] = dict(out_str_dict)
+    axm.common.compile_output()
+
+
+# The output strings are compiled, but the result has to be the same as
+# replacing $input_txt and then $output_txt in the output string, even
+# when the input text has one of the variables in it.
+@check
+def output_string():
+    file_section = ("check", "strings")
+    out_str_list = [
+        "$input_txt",
+        "$output_txt",
+        "literal",
+        "[$input_txt] [$output_txt]",
+        "$output_txt/$input_txt/$output_txt",
+        "",
+    ]
+    out_str_dict = {
+        f"checkCol{out_num}": out_str for out_num, out_str in enumerate(out_str_list)
+    }
+    _set_output_strings(file_section, out_str_dict)
+    input_list = ["text", "", "has $output_txt", "has $input_txt", "$output_txt"]
+    for output_func in (None, str.upper):
+        for output_col, out_str in out_str_dict.items():
+            axm.output.set_func(output_col, output_func)
+            for input_txt in input_list:
+                expected = axm.output._replace_vars(out_str, output_func, input_txt)
+                expect(
+                    f"{out_str!r} with {input_txt!r}",
+                    axm.output.string(file_section, output_col, input_txt),
+                    expected,
+                )
+    axm.output.set_func("checkCol3", str.upper)
+    expect(
+        "input text with $output_txt",
+        axm.output.string(file_section, "checkCol3", "a $output_txt"),
+        "[a A $OUTPUT_TXT] [A $OUTPUT_TXT]",
+    )
+    expect(
+        "missing output column",
+        axm.output.string(file_section, "checkMissing", "text"),
+        "",
+    )
+
+
+# Once specialize() and inherit() have been run, an OverlayTable has to
+# hold the same as a regular dictionary going through them, which is
+# what was used before (duplicates and avoided file-section pairs included).
+@check
+def overlay_table():
+    file_section_list = [
+        ("common", "common"),
+        ("inv", "common"),
+        ("inv", "Sheet1"),
+        ("inv", "Sheet2"),
+        ("other", "Sheet1"),
+        ("other", "Notes"),
+    ]
+    axm.common.avoid_list.append(("other", "Notes"))
+    # specialize() finds every file-section pair through these.
+    for file_section in file_section_list:
+        axm.common.column_output_dict[file_section] = {}
+    layer_dict_list = [
+        {
+            ("common", "common"): ["a", "b", "a"],
+            ("inv", "common"): ["c", "a", "c", "d"],
+            ("inv", "Sheet1"): ["d", "e", "d"],
+        },
+        {
+            ("inv", "common"): ["c", "c"],
+            ("other", "Sheet1"): ["f"],
+        },
+        {
+            ("common", "common"): {"a": ["A"], "b": ["B"]},
+            ("inv", "common"): {"a": ["INV A"], "c": ["C"]},
+            ("inv", "Sheet2"): {"c": ["SHEET C"], "d": ["D"]},
+        },
+    ]
+    for layer_dict in layer_dict_list:
+        factory = type(next(iter(layer_dict.values())))
+        plain_dict = {}
+        table = axm.common.OverlayTable(factory)
+        for file_section, layer in layer_dict.items():
+            plain_dict[file_section] = factory(layer)
+            table[file_section] = factory(layer)
+        for to_check in (plain_dict, table):
+            axm.common.specialize(to_check)
+            axm.common.inherit(to_check)
+        expect(f"keys of {layer_dict}", set(table), set(plain_dict))
+        for file_section in plain_dict:
+            expect(
+                f"{file_section} of {layer_dict}",
+                table[file_section],
+                plain_dict[file_section],
+            )
+
+
+# HeaderIndex.find() has to give the same header as looking through
+# every header, first for an exact match and then for one containing
+# what is searched (which was done for every output column before).
+@check
+def header_index():
+    # The same "random" headers are used on every run.
+    rand = random.Random(0)
+    alphabet = "abcAB ßé_"
+    for _ in range(200):
+        header_list = [
+            "".join(rand.choice(alphabet) for _ in range(rand.randrange(8)))
+            for _ in range(rand.randrange(1, 12))
+        ]
+        header_index = axm.common.HeaderIndex(header_list)
+        needle_list = [header.upper() for header in header_list]
+        for header in header_list:
+            start = rand.randrange(len(header) + 1)
+            needle_list.append(header[start : rand.randrange(start, len(header) + 1)])
+        needle_list.extend(
+            "".join(rand.choice(alphabet) for _ in range(rand.randrange(5))).upper()
+            for _ in range(10)
+        )
+        for needle in needle_list:
+            expected = None
+            for header in header_list:
+                if header.upper() == needle:
+                    expected = header
+                    break
+            if expected is None:
+                for header in header_list:
+                    if needle in header.upper():
+                        expected = header
+                        break
+            # Looked up twice, as the result is kept for next time.
+            for _ in range(2):
+                expect(
+                    f"{needle!r} in {header_list}", header_index.find(needle), expected
+                )
+    expect(
+        "index for the same headers",
+        axm.common.get_header_index(["a", "b"])
+        is axm.common.get_header_index(("a", "b")),
+        True,
+    )
+
+
+# The file name used in the axm file for file_name,
+# found without anything being memoized.
+def _find_file_name(file_name):
+    axm_file_set = {
+        file_section[0] for file_section in axm.common.get_file_section_set()
+    }
+    for axm_file_name in (
+        file_name,
+        os.path.abspath(file_name),
+        os.path.relpath(file_name),
+        os.path.basename(file_name),
+    ):
+        if axm_file_name in axm_file_set:
+            return axm_file_name
+    file_ext_pos = file_name.rfind(".")
+    if file_ext_pos != -1 and len(file_name) > 1:
+        return _find_file_name(file_name[:file_ext_pos])
+    return ""
+
+
+def _find_sect_name(sect_name):
+    axm_sect_set = {
+        file_section[1] for file_section in axm.common.get_file_section_set()
+    }
+    for axm_sect_name in (sect_name, sect_name.strip()):
+        if axm_sect_name in axm_sect_set:
+            return axm_sect_name
+    return ""
+
+
+def _find_file_sect(file_name, sect_name):
+    file_section_set = axm.common.get_file_section_set()
+    axm_file_name = _find_file_name(file_name) or axm.common.file_fallback
+    axm_sect_name = _find_sect_name(sect_name) or axm.common.sect_fallback
+    for file_section in (
+        (axm_file_name, axm_sect_name),
+        (axm_file_name, axm.common.sect_fallback),
+        (axm.common.file_fallback, axm.common.sect_fallback),
+    ):
+        if file_section in file_section_set:
+            return file_section
+    return None
+
+
+# File and section names are memoized, so they have to be looked up
+# again whenever the file-section pairs or the avoid list change.
+@check
+def name_resolution():
+    lookup_list = [
+        ("inv.xlsx", "Sheet1"),
+        ("inv.xlsx", " Sheet1 "),
+        ("data/inv.xlsx", "Sheet2"),
+        (os.path.abspath("abs/inv.xlsx"), "Sheet2"),
+        ("inv.backup.xlsx", "Sheet3"),
+        ("other.xlsx", "Notes"),
+        ("missing.xlsx", "Sheet1"),
+    ]
+    change_list = [
+        lambda: axm.common.set_file_section_source([("inv", "Sheet1")]),
+        lambda: axm.common.avoid_list.append(("other", "Notes")),
+        lambda: axm.common.set_file_section_source([("common", "common")]),
+        lambda: axm.common.set_file_section_source(
+            [(os.path.abspath("abs/inv.xlsx"), "Sheet2"), ("inv.backup", "common")]
+        ),
+    ]
+    for change_num, change in enumerate(change_list, 1):
+        change()
+        # Looked up twice, as the result is kept for next time.
+        for _ in range(2):
+            for file_name, sect_name in lookup_list:
+                what = f"after change {change_num}, {file_name!r}"
+                expect(
+                    what,
+                    axm.common.get_file_name(file_name),
+                    _find_file_name(file_name),
+                )
+                expect(
+                    f"after change {change_num}, {sect_name!r}",
+                    axm.common.get_sect_name(sect_name),
+                    _find_sect_name(sect_name),
+                )
+                expect(
+                    f"{what} {sect_name!r}",
+                    axm.common.get_file_sect(file_name, sect_name),
+                    _find_file_sect(file_name, sect_name),
+                )
+    expect(
+        "file and section",
+        axm.common.get_file_sect("data/inv.xlsx", " Sheet1"),
+        ("inv", "Sheet1"),
+    )
+
+
+# A RowRecord has to act the same as the dictionary that was used for
+# the current row before, except that anything that isn't a column is
+# left out. Its values in column order are what ends up in the output.
+@check
+def row_record():
+    rand = random.Random(0)
+    column_tuple = ("name", "code", "description", "fullName", "importId")
+    row_record = common.RowRecord(column_tuple)
+    row_dict = {}
+    for step_num in range(2000):
+        column = rand.choice(column_tuple + ("notAColumn",))
+        step = rand.randrange(5)
+        if step == 0:
+            row_record[column] = row_dict[column] = f"value {step_num}"
+        elif step == 1 and column in column_tuple:
+            row_dict[column] = f"value {step_num}"
+            row_record.set_at(row_record.index(column), row_dict[column])
+        elif step == 2:
+            row_record.clear()
+            row_dict.clear()
+        else:
+            expect(
+                f"get {column}", row_record.get(column, "-"), row_dict.get(column, "-")
+            )
+        # Anything that isn't a column isn't kept.
+        row_dict.pop("notAColumn", None)
+        expect(f"step {step_num}: len", len(row_record), len(row_dict))
+        expect(f"step {step_num}: bool", bool(row_record), bool(row_dict))
+        expect(
+            f"step {step_num}: {column} in", column in row_record, column in row_dict
+        )
+        expect(
+            f"step {step_num}: list",
+            row_record.to_list(),
+            [row_dict.get(column, "") for column in column_tuple],
+        )
+    row_record.clear()
+    try:
+        row_record["name"]
+    except KeyError:
+        pass
+    else:
+        raise CheckFailed("a column that isn't set can be looked up")
+
+
+def _step_a():
+    pass
+
+
+def _step_b():
+    pass
+
+
+def _step_c():
+    pass
+
+
+# The scheduler has to run steps with the lowest nice value first and
+# steps with the same nice value in the order they were added, whatever
+# was removed, purged or moved along the way.
+@check
+def scheduler():
+    rand = random.Random(0)
+    step_list = [_step_a, _step_b, _step_c]
+    # (nice, step) for every step, in the order they should be run
+    # within each nice value.
+    expected_list = []
+
+    def get_nice_list(nice):
+        return [item for item in expected_list if item[0] == nice]
+
+    for step_num in range(3000):
+        nice = rand.randrange(6)
+        action = rand.randrange(7)
+        if action <= 1:
+            step = rand.choice(step_list)
+            axm.scheduler.add(step, nice)
+            expected_list.append((nice, step))
+        elif action == 2:
+            axm.scheduler.remove_first(nice)
+            if nice_list := get_nice_list(nice):
+                expected_list.remove(nice_list[0])
+        elif action == 3:
+            axm.scheduler.remove_last(nice)
+            if get_nice_list(nice):
+                last_index = max(
+                    index for index, item in enumerate(expected_list) if item[0] == nice
+                )
+                del expected_list[last_index]
+        elif action == 4 and rand.randrange(4) == 0:
+            axm.scheduler.purge(nice)
+            expected_list = [item for item in expected_list if item[0] != nice]
+        elif action == 5 and rand.randrange(4) == 0:
+            step = rand.choice(step_list)
+            axm.scheduler.purge_func(step.__name__)
+            expected_list = [item for item in expected_list if item[1] is not step]
+        elif action == 6:
+            final_nice = rand.randrange(6)
+            axm.scheduler.move(nice, final_nice)
+            if nice != final_nice:
+                moved_list = get_nice_list(nice)
+                expected_list = [item for item in expected_list if item[0] != nice]
+                expected_list.extend((final_nice, item[1]) for item in moved_list)
+        nice_set = {item[0] for item in expected_list}
+        expect(
+            f"step {step_num}: count",
+            axm.scheduler.count(nice),
+            len(get_nice_list(nice)),
+        )
+        expect(
+            f"step {step_num}: lowest",
+            axm.scheduler.lowest_nice_val(),
+            min(nice_set, default=None),
+        )
+        expect(
+            f"step {step_num}: highest",
+            axm.scheduler.highest_nice_val(),
+            max(nice_set, default=None),
+        )
+        if step_num % 50 == 0:
+            func_deque = axm.scheduler.get(axm.scheduler.ALL_SCHEDULED)
+            expect(
+                f"step {step_num}: order",
+                [definition.func for definition in func_deque or ()],
+                [item[1] for item in sorted(expected_list, key=lambda item: item[0])],
+            )
+
+
+# The lexer has to tell commands, operators and comments apart and keep
+# track of the line each one is on. The operators it finds in a line have
+# to be the ones whose find_func() finds them, which is how every operator
+# was looked for before.
+@check
+def lexer():
+    text = "\n".join(
+        [
+            "!AXM 3.0",
+            "",
+            "# A comment on its own.",
+            "name: NAME, ID # A comment after an operator.",
+            "!SECT[FILE: inv, SECTION: Sheet1]",
+            "~purchasePrice: COST",
+            'description < "$input_txt: $output_txt"',
+            "internalDescription> description",
+            "no operator here",
+        ]
+    )
+    expect(
+        "tokens",
+        [tuple(token) for token in axm.lexer.tokenize(text)],
+        [
+            (axm.lexer.TOKEN_COMMAND, "AXM", "!AXM 3.0", 1),
+            (axm.lexer.TOKEN_COMMENT, None, "A comment on its own.", 3),
+            (axm.lexer.TOKEN_COMMENT, None, "A comment after an operator.", 4),
+            (axm.lexer.TOKEN_OPERATOR, "assign", "name: NAME, ID", 4),
+            (axm.lexer.TOKEN_COMMAND, "SECT", "!SECT[FILE: inv, SECTION: Sheet1]", 5),
+            (axm.lexer.TOKEN_OPERATOR, "opt", "~purchasePrice: COST", 6),
+            (
+                axm.lexer.TOKEN_OPERATOR,
+                "importer",
+                'description < "$input_txt: $output_txt"',
+                7,
+            ),
+            (
+                axm.lexer.TOKEN_OPERATOR,
+                "delegator",
+                "internalDescription> description",
+                8,
+            ),
+            (axm.lexer.TOKEN_OPERATOR, None, "no operator here", 9),
+        ],
+    )
+    rand = random.Random(0)
+    oper_dict = {
+        oper_name: axm.operator.get(oper_name)
+        for oper_name in ("opt", "assign", "delegator", "importer")
+    }
+    for _ in range(5000):
+        line = "".join(rand.choice('ab :><~",') for _ in range(rand.randrange(1, 10)))
+        line = line.strip()
+        if not line:
+            continue
+        found_dict = {}
+        for oper_name, oper in oper_dict.items():
+            oper_pos = oper.find_func(line)
+            if oper_pos > -1:
+                found_dict[oper_name] = oper_pos
+        expect(
+            f"operators in {line!r}", axm.operator.find_names(line), list(found_dict)
+        )
+        expect(
+            f"first operator in {line!r}",
+            axm.operator.lfind_name(line),
+            min(found_dict, key=found_dict.get, default=None),
+        )
+
+
+# A command is only acted upon if its check_func() agrees, and every
+# operator in a line is acted upon, in the order they were added.
+@check
+def parser():
+    acted_list = []
+    if axm.command.get("CHECKED") is None:
+        axm.command.add(
+            "CHECKED",
+            lambda line: line.endswith("yes"),
+            lambda line: acted_list.append(line),
+        )
+    axm.parser.init({})
+    axm.parser.parse(io.StringIO("!AXM 3.0\n!CHECKED no\n!CHECKED yes\n~name: NAME\n"))
+    expect("commands acted upon", acted_list, ["!CHECKED yes"])
+    file_section = (axm.common.cur_file, axm.common.cur_sect)
+    expect("optional", axm.common.opt_dict[file_section], ["name"])
+    expect("assigned", axm.common.out_input_col[file_section], {"name": ["NAME"]})
+
+
+# Throws away everything a check might have left behind.
+def _reset():
+    axm.common.reset()
+    axm.parser.reset()
+    axm.scheduler.reset()
+    axm.utils.reset()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("check", nargs="*", help="Checks to run (all by default)")
+    args = parser.parse_args()
+
+    num_failed = 0
+    for check_func in _check_list:
+        check_name = check_func.__name__
+        if args.check and check_name not in args.check:
+            continue
+        _reset()
+        try:
+            check_func()
+        except CheckFailed as check_error:
+            num_failed += 1
+            print(f"FAIL {check_name}: {check_error}")
+            continue
+        print(f"ok   {check_name}")
+    if num_failed:
+        print(f"{num_failed} check(s) failed.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+"""Checks that every test workbook is converted to its expected CSV file."""
+
+import argparse
+import csv
+import glob
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_PATH = os.path.join(SCRIPT_DIR, "ax-invconv.py")
+TEST_DIR = os.path.join(SCRIPT_DIR, "test")
+# Run times that are compared with by --compare unless --baseline is
+# given. It is made with "golden.py --save bench/golden-baseline.json"
+# and has to be made again whenever the fixtures change, everything got
+# faster or it is run on a different machine.
+BASELINE_PATH = os.path.join(SCRIPT_DIR, "bench", "golden-baseline.json")
+
+# The format of the results. Results in a different
+# format can't be compared with each other.
+RESULT_FORMAT = 1
+
+# Runs taking less time than this (in seconds) are too
+# noisy to be compared with a baseline.
+MIN_COMPARE_TIME = 0.05
+
+# Arguments given to ax-invconv.py for every way of running it.
+# "library" and "threads" aren't run through ax-invconv.py (see
+# run_library() and run_threads()).
+MODE_ARGS = {
+    "sequential": [],
+    "no-cache": ["--no-cache"],
+    "pipeline": ["--pipeline"],
+    # Every couple of rows goes to a different process,
+    # so that merging the results is actually tested.
+    "chunked": ["-j", "2", "--chunk-rows", "2"],
+    "library": None,
+    "threads": None,
+}
+
+
+# Returns the name of every test workbook that comes with the
+# CSV file it should be converted to, such as "002-script_workout".
+def get_fixtures():
+    fixture_list = []
+    for csv_path in sorted(glob.glob(os.path.join(TEST_DIR, "*.csv"))):
+        fixture = os.path.splitext(os.path.basename(csv_path))[0]
+        if os.path.isfile(os.path.join(TEST_DIR, fixture + ".xlsx")):
+            fixture_list.append(fixture)
+    return fixture_list
+
+
+# Returns the map file a fixture is converted with. A fixture can come
+# with its own map file (such as "006-axm_features.axm"), otherwise the
+# default map file is used.
+def get_map_file(fixture):
+    map_path = os.path.join(TEST_DIR, fixture + ".axm")
+    if os.path.isfile(map_path):
+        return map_path
+    return os.path.join(SCRIPT_DIR, "default.axm")
+
+
+# Converts input_path with ax-invconv.py. Returns an error
+# message if the script failed, otherwise None.
+def run_script(input_path, map_file, output_path, log_path, mode_args):
+    command = [sys.executable, SCRIPT_PATH, "-l", log_path, "-o", output_path]
+    command.extend(["-m", map_file])
+    command.extend(mode_args)
+    command.append(input_path)
+    result = subprocess.run(
+        command,
+        cwd=SCRIPT_DIR,
+        # Nobody is there to answer if the script asks anything.
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    if result.returncode != 0:
+        return result.stderr.strip().splitlines()[-1:] or [f"exit {result.returncode}"]
+    return None
+
+
+# Imports the script to use it as a library. Everything is logged to
+# log_path only, so that nothing is written to the console (not even
+# by loguru's default handler).
+def import_library(log_path):
+    if SCRIPT_DIR not in sys.path:
+        sys.path.insert(0, SCRIPT_DIR)
+    from loguru import logger
+
+    # Some modules already log something when they are imported.
+    logger.remove()
+    import conversion
+    import msg_handler
+
+    msg_handler.add_levels()
+    logger.add(log_path, backtrace=True, errors="replace")
+    return conversion
+
+
+# Converts input_path with conversion.convert(), the
+# way the script is used as a library.
+def run_library(input_path, map_file, output_path, log_path):
+    conversion = import_library(log_path)
+    cwd = os.getcwd()
+    os.chdir(SCRIPT_DIR)
+    try:
+        with open(output_path, "w", newline="") as output_fptr:
+            csv.writer(output_fptr, dialect="excel").writerows(
+                conversion.convert([input_path], map_file)
+            )
+    except Exception as convert_error:
+        return [repr(convert_error)]
+    finally:
+        os.chdir(cwd)
+    return None
+
+
+# Converts input_path as a library in one thread while another fixture,
+# converted with a different map file if there is one, is converted in
+# another thread. The conversions take turns after every row, and the
+# output of the other fixture has to be right as well.
+def run_threads(input_path, map_file, output_path, log_path):
+    fixture = os.path.splitext(os.path.basename(input_path))[0]
+    other_list = [other for other in get_fixtures() if other != fixture]
+    if not other_list:
+        return ["another fixture is needed"]
+    other_fixture = other_list[0]
+    for other in other_list:
+        if get_map_file(other) != map_file:
+            other_fixture = other
+            break
+    other_output_path = output_path + ".other"
+    job_list = [
+        (input_path, map_file, output_path),
+        (
+            os.path.join(TEST_DIR, other_fixture + ".xlsx"),
+            get_map_file(other_fixture),
+            other_output_path,
+        ),
+    ]
+    # Imported before the threads start, as it changes the log handlers.
+    conversion = import_library(log_path)
+    error_list = []
+
+    def convert(job_input_path, job_map_file, job_output_path):
+        with open(job_output_path, "w", newline="") as output_fptr:
+            try:
+                csv.writer(output_fptr, dialect="excel").writerows(
+                    conversion.convert([job_input_path], job_map_file, batch_rows=1)
+                )
+            except Exception as convert_error:
+                error_list.append(repr(convert_error))
+
+    cwd = os.getcwd()
+    os.chdir(SCRIPT_DIR)
+    try:
+        thread_list = [threading.Thread(target=convert, args=job) for job in job_list]
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+    finally:
+        os.chdir(cwd)
+    if error_list:
+        return error_list
+    with open(os.path.join(TEST_DIR, other_fixture + ".csv"), "rb") as expected_fptr:
+        with open(other_output_path, "rb") as output_fptr:
+            if output_fptr.read() != expected_fptr.read():
+                return [f"output of {other_fixture} (in the other thread) differs"]
+    return None
+
+
+# Returns a list of runs that are slower than in
+# baseline_dict by more than tolerance (a fraction).
+def compare(result_dict, baseline_dict, tolerance):
+    if baseline_dict.get("format") != RESULT_FORMAT:
+        raise ValueError("baseline is in a different format")
+    slow_list = []
+    for key, cur_time in result_dict["times"].items():
+        baseline_time = baseline_dict["times"].get(key)
+        if baseline_time is None or max(baseline_time, cur_time) < MIN_COMPARE_TIME:
+            continue
+        if cur_time > baseline_time * (1 + tolerance):
+            slow_list.append((key, baseline_time, cur_time))
+    return slow_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-m",
+        "--mode",
+        action="append",
+        choices=list(MODE_ARGS),
+        help="Only run in this mode (can be given more than once)",
+    )
+    parser.add_argument(
+        "-r", "--runs", type=int, default=3, help="Number of times to run each"
+    )
+    parser.add_argument("-s", "--save", help="Save the run times to a JSON file")
+    parser.add_argument(
+        "-c",
+        "--compare",
+        action="store_true",
+        help="Fail if slower than the run times in the baseline",
+    )
+    parser.add_argument(
+        "-b",
+        "--baseline",
+        default=BASELINE_PATH,
+        help="JSON file with the run times compared with"
+        " (bench/golden-baseline.json by default)",
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.5,
+        help="How much slower (as a fraction) a run may be with --compare",
+    )
+    parser.add_argument("fixture", nargs="*", help="Fixtures to run (all by default)")
+    args = parser.parse_args()
+
+    fixture_list = args.fixture or get_fixtures()
+    mode_list = args.mode or list(MODE_ARGS)
+    result_dict = {
+        "format": RESULT_FORMAT,
+        "python": platform.python_version(),
+        "times": {},
+    }
+    num_failed = 0
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_path = os.path.join(temp_dir, "golden.log")
+        for fixture in fixture_list:
+            input_path = os.path.join(TEST_DIR, fixture + ".xlsx")
+            map_file = get_map_file(fixture)
+            with open(os.path.join(TEST_DIR, fixture + ".csv"), "rb") as expected_fptr:
+                expected_bytes = expected_fptr.read()
+            for mode in mode_list:
+                output_path = os.path.join(temp_dir, f"{fixture}-{mode}.csv")
+                # The fastest run is used, as the slower ones
+                # mostly measure noise from the rest of the system.
+                best_time = None
+                error = None
+                for _ in range(args.runs):
+                    if os.path.exists(output_path):
+                        os.remove(output_path)
+                    start_time = time.perf_counter()
+                    if mode == "threads":
+                        error = run_threads(input_path, map_file, output_path, log_path)
+                    elif MODE_ARGS[mode] is None:
+                        error = run_library(input_path, map_file, output_path, log_path)
+                    else:
+                        error = run_script(
+                            input_path, map_file, output_path, log_path, MODE_ARGS[mode]
+                        )
+                    run_time = time.perf_counter() - start_time
+                    if error is not None:
+                        break
+                    if best_time is None or run_time < best_time:
+                        best_time = run_time
+                if error is None:
+                    with open(output_path, "rb") as output_fptr:
+                        if output_fptr.read() != expected_bytes:
+                            error = ["output differs from the expected CSV file"]
+                if error is not None:
+                    num_failed += 1
+                    print(f"FAIL {fixture} ({mode}): {' '.join(error)}")
+                    continue
+                result_dict["times"][f"{fixture}/{mode}"] = best_time
+                print(f"ok   {fixture} ({mode}) {best_time * 1000:.1f} ms")
+
+    if args.save:
+        with open(args.save, "w") as save_fptr:
+            json.dump(result_dict, save_fptr, indent=2)
+            save_fptr.write("\n")
+    if num_failed:
+        print(f"{num_failed} run(s) failed.", file=sys.stderr)
+        return 1
+    if args.compare:
+        with open(args.baseline) as baseline_fptr:
+            baseline_dict = json.load(baseline_fptr)
+        try:
+            slow_list = compare(result_dict, baseline_dict, args.tolerance)
+        except ValueError as compare_error:
+            print(
+                f"Can't compare with {args.baseline}: {compare_error}.", file=sys.stderr
+            )
+            return 2
+        for key, baseline_time, cur_time in slow_list:
+            print(
+                f"{key} took {cur_time * 1000:.1f} ms"
+                f" (was {baseline_time * 1000:.1f} ms).",
+                file=sys.stderr,
+            )
+        if slow_list:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
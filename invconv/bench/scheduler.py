@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+"""Times adding and draining a large number of scheduled steps."""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import axm.scheduler as scheduler
+
+
+def _step():
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-s", "--steps", type=int, default=100000, help="Number of steps to add"
+    )
+    parser.add_argument(
+        "-n", "--nice", type=int, default=50, help="Number of distinct nice values"
+    )
+    parser.add_argument(
+        "-b",
+        "--budget",
+        type=float,
+        default=None,
+        help="Fail if adding and draining takes longer (in milliseconds)",
+    )
+    args = parser.parse_args()
+
+    # The same "random" nice values are used on every run
+    # so that results can be compared.
+    rand = random.Random(0)
+    nice_list = [rand.randrange(args.nice) for _ in range(args.steps)]
+
+    start_time = time.perf_counter()
+    for nice in nice_list:
+        scheduler.add(_step, nice)
+    add_time = time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    func_deque = scheduler.get(scheduler.ALL_SCHEDULED)
+    while func_deque:
+        func_deque.popleft().run()
+    drain_time = time.perf_counter() - start_time
+
+    total_ms = (add_time + drain_time) * 1000
+    print(f"Steps: {args.steps} over {args.nice} nice values")
+    print(f"Add: {add_time * 1000:.1f} ms")
+    print(f"Drain: {drain_time * 1000:.1f} ms")
+    if args.budget is not None and total_ms > args.budget:
+        print(f"Total of {total_ms:.1f} ms is over budget.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+"""Checks that ax-invconv.py starts up within a set time budget."""
+
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+# The amount of time (in milliseconds) that all
+# imports done by "ax-invconv.py --help" may take.
+DEFAULT_BUDGET_MS = 200
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_PATH = os.path.join(SCRIPT_DIR, "ax-invconv.py")
+
+IMPORT_TIME_PREFIX = "import time:"
+
+
+# Runs the script once with -X importtime and returns the
+# wall time along with the cumulative import time (in
+# microseconds) of every module imported at the top level.
+def measure(script_args):
+    command = [sys.executable, "-X", "importtime", SCRIPT_PATH]
+    command.extend(script_args)
+    start_time = time.perf_counter()
+    result = subprocess.run(
+        command,
+        cwd=SCRIPT_DIR,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    wall_time = time.perf_counter() - start_time
+    import_dict = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith(IMPORT_TIME_PREFIX):
+            continue
+        field_list = line.removeprefix(IMPORT_TIME_PREFIX).split("|")
+        cumulative_str = field_list[1].strip()
+        module_name = field_list[2]
+        # Nested imports are indented by two spaces per level.
+        # Their time is already part of the top-level module.
+        if not cumulative_str.isdecimal() or module_name[1:].startswith(" "):
+            continue
+        import_dict[module_name.strip()] = int(cumulative_str)
+    return wall_time, import_dict
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument(
+        "-b",
+        "--budget",
+        type=float,
+        default=DEFAULT_BUDGET_MS,
+        help="Maximum total import time in milliseconds",
+    )
+    parser.add_argument(
+        "-r", "--runs", type=int, default=5, help="Number of times to start script"
+    )
+    parser.add_argument(
+        "-n", "--top", type=int, default=10, help="Number of slowest imports to show"
+    )
+    parser.add_argument(
+        "script_args",
+        nargs="*",
+        default=["--help"],
+        help="Arguments passed to ax-invconv.py (--help by default)",
+    )
+    args = parser.parse_args()
+
+    # The fastest run is used, as the slower ones
+    # mostly measure noise from the rest of the system.
+    best_wall_time = None
+    best_import_dict = None
+    best_import_time = None
+    for _ in range(args.runs):
+        wall_time, import_dict = measure(args.script_args)
+        import_time = sum(import_dict.values()) / 1000
+        if best_import_time is None or import_time < best_import_time:
+            best_import_time = import_time
+            best_import_dict = import_dict
+        if best_wall_time is None or wall_time < best_wall_time:
+            best_wall_time = wall_time
+
+    print(f"Wall time: {best_wall_time * 1000:.1f} ms")
+    print(f"Import time: {best_import_time:.1f} ms (budget {args.budget:.1f} ms)")
+    slowest_list = sorted(best_import_dict.items(), key=lambda item: -item[1])
+    for module_name, cumulative_time in slowest_list[: args.top]:
+        print(f"    {cumulative_time / 1000:8.1f} ms  {module_name}")
+    if best_import_time > args.budget:
+        print("Import time is over budget.", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
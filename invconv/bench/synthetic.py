@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+"""Times every stage of converting a generated workbook with ax-invconv.py."""
+
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import openpyxl
+
+SCRIPT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRIPT_PATH = os.path.join(SCRIPT_DIR, "ax-invconv.py")
+
+# The format of the results. Results in a different
+# format can't be compared with each other.
+RESULT_FORMAT = 2
+
+# Stages taking less time than this (in seconds) are too
+# noisy to be compared with a baseline.
+MIN_COMPARE_TIME = 0.005
+
+# Columns understood by default.axm, in the order they are added.
+# Any other columns don't map to anything.
+MAPPED_HEADERS = (
+    "Name",
+    "Description",
+    "Category",
+    "Family",
+    "Unit",
+    "Purchase Price",
+    "Price",
+    "Code",
+)
+CATEGORIES = (
+    "Accomodation",
+    "Case",
+    "Hard Disk",
+    "Hosting",
+    "Maintenance",
+    "Meal",
+    "Memory",
+    "Motherboard",
+    "Non-perishable",
+    "Package",
+    "Perishable",
+    "Printer",
+)
+FAMILIES = ("Components", "Consumables", "Equipment", "Services")
+UNITS = ("Box of 12 Pces", "Centimeter", "Day", "Unit", "%", "hours")
+EMOJI = ("\U0001f600", "\U0001f4e6", "\U0001f69a", "☕", "\U0001f9c0")
+
+# Arguments given to ax-invconv.py for every way of running it.
+MODE_ARGS = {
+    "sequential": [],
+    "pipeline": ["--pipeline"],
+    "chunked": ["-j", "2"],
+}
+
+
+# Returns the value of a single cell. n is the number of the row.
+def get_cell(header, n, rand, args):
+    if header == "Name":
+        val = f"Product #{n}"
+    elif header == "Description":
+        val = f"Description of product #{n}"
+        if rand.random() < args.multiline:
+            val += f"\nSecond line of product #{n}"
+    elif header == "Category":
+        val = CATEGORIES[rand.randrange(min(args.categories, len(CATEGORIES)))]
+    elif header == "Family":
+        val = FAMILIES[rand.randrange(min(args.categories, len(FAMILIES)))]
+    elif header == "Unit":
+        val = rand.choice(UNITS)
+    elif header in ("Purchase Price", "Price"):
+        if rand.random() < 0.5:
+            return round(rand.uniform(0.5, 500), 2)
+        val = f"{rand.uniform(0.5, 500):.2f}$"
+    elif header == "Code":
+        val = f"{CATEGORIES[n % len(CATEGORIES)][:3]}-{n}"
+    else:
+        val = f"{header} {n}"
+    if rand.random() < args.emoji:
+        val = rand.choice(EMOJI) + val + rand.choice(EMOJI)
+    return val
+
+
+# The same "random" workbook is generated for the same arguments,
+# so that results can be compared.
+def generate(workbook_path, args):
+    rand = random.Random(args.seed)
+    header_list = list(MAPPED_HEADERS[: args.cols])
+    while len(header_list) < args.cols:
+        header_list.append(f"Extra {len(header_list) - len(MAPPED_HEADERS) + 1}")
+    # Write-only workbooks don't record their dimensions,
+    # which the script needs.
+    wb = openpyxl.Workbook()
+    wb.remove(wb.active)
+    for sheet_num in range(args.sheets):
+        ws = wb.create_sheet(f"Sheet{sheet_num + 1}")
+        ws.append(header_list)
+        for row_num in range(args.rows):
+            n = sheet_num * args.rows + row_num
+            row = []
+            for header in header_list:
+                # The name is never blank, or the row is left out.
+                if header != "Name" and rand.random() < args.blank_ratio:
+                    row.append(None)
+                else:
+                    row.append(get_cell(header, n, rand, args))
+            ws.append(row)
+    wb.save(workbook_path)
+
+
+# Converts workbook_path with ax-invconv.py, the same way as it is
+# run by users, and returns the stages recorded with --metrics (see
+# metrics.py) along with the wall time of the whole run as "total".
+def run_once(workbook_path, temp_dir, mode_args):
+    metrics_path = os.path.join(temp_dir, "metrics.json")
+    output_path = os.path.join(temp_dir, "Product.csv")
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    command = [
+        sys.executable,
+        SCRIPT_PATH,
+        "-l",
+        os.path.join(temp_dir, "synthetic.log"),
+        "-o",
+        output_path,
+        "--metrics",
+        metrics_path,
+        # Everything is parsed from scratch, so
+        # compiling the map file is actually timed.
+        "--no-cache",
+    ]
+    command.extend(mode_args)
+    command.append(workbook_path)
+    start_time = time.perf_counter()
+    result = subprocess.run(
+        command,
+        cwd=SCRIPT_DIR,
+        # Nobody is there to answer if the script asks anything.
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        text=True,
+    )
+    total_time = time.perf_counter() - start_time
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"ax-invconv.py exited with {result.returncode}: {result.stderr.strip()}"
+        )
+    with open(metrics_path) as metrics_fptr:
+        stage_dict = json.load(metrics_fptr)["stages"]
+    stage_dict["total"] = {"wall_time": total_time}
+    return stage_dict
+
+
+# Returns a list of stages that are slower than in
+# baseline_dict by more than tolerance (a fraction).
+def compare(result_dict, baseline_dict, tolerance):
+    if baseline_dict.get("format") != RESULT_FORMAT:
+        raise ValueError("baseline is in a different format")
+    if baseline_dict.get("params") != result_dict["params"]:
+        raise ValueError("baseline was made with a different workbook")
+    slow_list = []
+    for name, stage_dict in result_dict["stages"].items():
+        baseline_stage = baseline_dict["stages"].get(name)
+        if baseline_stage is None:
+            continue
+        baseline_time = baseline_stage["seconds"]
+        cur_time = stage_dict["seconds"]
+        if max(baseline_time, cur_time) < MIN_COMPARE_TIME:
+            continue
+        if cur_time > baseline_time * (1 + tolerance):
+            slow_list.append((name, baseline_time, cur_time))
+    return slow_list
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    # The sequential mode opens the workbook again for every
+    # cell, so it takes a long time on anything much bigger.
+    parser.add_argument("--rows", type=int, default=200, help="Rows in each sheet")
+    parser.add_argument(
+        "--cols",
+        type=int,
+        default=len(MAPPED_HEADERS),
+        help=f"Columns in each sheet (past {len(MAPPED_HEADERS)}, they aren't mapped)",
+    )
+    parser.add_argument("--sheets", type=int, default=1, help="Number of sheets")
+    parser.add_argument(
+        "--blank-ratio", type=float, default=0.1, help="Fraction of cells left blank"
+    )
+    parser.add_argument(
+        "--categories",
+        type=int,
+        default=4,
+        help="Number of different categories and families used",
+    )
+    parser.add_argument(
+        "--emoji", type=float, default=0.0, help="Fraction of cells with emoji"
+    )
+    parser.add_argument(
+        "--multiline",
+        type=float,
+        default=0.0,
+        help="Fraction of descriptions with two lines",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    parser.add_argument(
+        "-m",
+        "--mode",
+        action="append",
+        choices=list(MODE_ARGS),
+        help="Only run in this mode (can be given more than once)",
+    )
+    parser.add_argument(
+        "-r", "--runs", type=int, default=3, help="Number of times to convert"
+    )
+    parser.add_argument(
+        "-w", "--workbook", help="Keep the generated workbook at this path"
+    )
+    parser.add_argument("-s", "--save", help="Save the results to a JSON file")
+    parser.add_argument(
+        "-c", "--compare", help="Fail if slower than the results in a JSON file"
+    )
+    parser.add_argument(
+        "-t",
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="How much slower (as a fraction) a stage may be with --compare",
+    )
+    args = parser.parse_args()
+
+    mode_list = args.mode or list(MODE_ARGS)
+    # The fastest run is used, as the slower ones mostly
+    # measure noise from the rest of the system. Indexed by
+    # mode and stage, such as "pipeline/convert".
+    best_time_dict = {}
+    # Rows and cells converted in every mode.
+    count_dict = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        workbook_path = args.workbook or os.path.join(temp_dir, "synthetic.xlsx")
+        generate(workbook_path, args)
+        for mode in mode_list:
+            for _ in range(args.runs):
+                stage_dict = run_once(workbook_path, temp_dir, MODE_ARGS[mode])
+                count_dict[mode] = (
+                    stage_dict["convert"]["rows"],
+                    stage_dict["convert"]["cells"],
+                )
+                for name, stats_dict in stage_dict.items():
+                    key = f"{mode}/{name}"
+                    stage_time = stats_dict["wall_time"]
+                    best_time_dict[key] = min(
+                        best_time_dict.get(key, stage_time), stage_time
+                    )
+
+    params_dict = {
+        key: getattr(args, key)
+        for key in (
+            "rows",
+            "cols",
+            "sheets",
+            "blank_ratio",
+            "categories",
+            "emoji",
+            "multiline",
+            "seed",
+        )
+    }
+    result_dict = {
+        "format": RESULT_FORMAT,
+        "params": params_dict,
+        "python": platform.python_version(),
+        "stages": {},
+    }
+    for key, stage_time in best_time_dict.items():
+        num_rows, num_cells = count_dict[key.split("/")[0]]
+        stage_dict = {
+            "seconds": stage_time,
+            "rows_per_sec": None,
+            "cells_per_sec": None,
+        }
+        if stage_time > 0:
+            stage_dict["rows_per_sec"] = num_rows / stage_time
+            stage_dict["cells_per_sec"] = num_cells / stage_time
+        result_dict["stages"][key] = stage_dict
+        print(
+            f"{key}: {stage_time * 1000:.1f} ms"
+            f" ({num_cells / stage_time if stage_time else 0:.0f} cells/s)"
+        )
+
+    if args.save:
+        with open(args.save, "w") as save_fptr:
+            json.dump(result_dict, save_fptr, indent=2)
+            save_fptr.write("\n")
+    if args.compare:
+        with open(args.compare) as baseline_fptr:
+            baseline_dict = json.load(baseline_fptr)
+        try:
+            slow_list = compare(result_dict, baseline_dict, args.tolerance)
+        except ValueError as compare_error:
+            print(
+                f"Can't compare with {args.compare}: {compare_error}.", file=sys.stderr
+            )
+            return 2
+        for name, baseline_time, cur_time in slow_list:
+            print(
+                f"{name} took {cur_time * 1000:.1f} ms"
+                f" (was {baseline_time * 1000:.1f} ms).",
+                file=sys.stderr,
+            )
+        if slow_list:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+"""Keeps the results of expensive parsing around between runs."""
+
+import hashlib
+import os
+import pickle
+
+from loguru import logger
+
+# Must be changed whenever the layout of
+# anything stored in the cache changes.
+CACHE_FORMAT = 2
+
+# Can be turned off so that the cache files are neither
+# read nor written and everything gets parsed from scratch.
+is_enabled = True
+
+# A process that does many conversions (see daemon.py) can also keep
+# what is cached in memory, which saves reading the cache files again.
+# This is done even if is_enabled is turned off, so that such a process
+# still only parses everything once. The values are kept pickled, so
+# every load gets its own copy.
+keep_in_memory = False
+_memory_dict = {}
+
+# Only builtin types should be stored in the cache. The script can
+# be imported as "common" or as "invconv.common", so a pickled class
+# from one of those modules can't always be found again when loading.
+
+
+def get_cache_dir():
+    cache_dir = os.environ.get("INVCONV_CACHE_DIR", "")
+    if not cache_dir:
+        base_dir = os.environ.get("XDG_CACHE_HOME", "")
+        if not base_dir:
+            base_dir = os.path.join(os.path.expanduser("~"), ".cache")
+        cache_dir = os.path.join(base_dir, "invconv")
+    return cache_dir
+
+
+# Every cached object is stored in its own file. The name
+# given is usually a path, so it is hashed to get a valid filename.
+def get_path(kind, name):
+    name_hash = hashlib.sha256(name.encode("utf-8", "surrogatepass")).hexdigest()
+    return os.path.join(get_cache_dir(), f"{kind}-{name_hash}.pickle")
+
+
+# Returns None if nothing is cached under the given name or if the
+# key stored with it doesn't match the given key (the cache is stale).
+def load(kind, name, key):
+    if keep_in_memory and (kind, name) in _memory_dict:
+        cache_key, cache_bytes = _memory_dict[(kind, name)]
+        if cache_key == (CACHE_FORMAT, key):
+            return pickle.loads(cache_bytes)
+    if not is_enabled:
+        return None
+    cache_path = get_path(kind, name)
+    try:
+        with open(cache_path, "rb") as cache_fptr:
+            cache_key, cache_val = pickle.load(cache_fptr)
+    except FileNotFoundError:
+        return None
+    except (OSError, EOFError, ValueError, TypeError, pickle.UnpicklingError):
+        logger.debug(f"Ignoring unreadable cache file {cache_path}.")
+        return None
+    if cache_key != (CACHE_FORMAT, key):
+        return None
+    if keep_in_memory:
+        _keep(kind, name, key, cache_val)
+    return cache_val
+
+
+def _keep(kind, name, key, val):
+    _memory_dict[(kind, name)] = (
+        (CACHE_FORMAT, key),
+        pickle.dumps(val, protocol=pickle.HIGHEST_PROTOCOL),
+    )
+
+
+def store(kind, name, key, val):
+    if keep_in_memory:
+        _keep(kind, name, key, val)
+    if not is_enabled:
+        return
+    cache_path = get_path(kind, name)
+    # Write to a temporary file first so that another instance
+    # of the script never reads a half-written cache file.
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(tmp_path, "wb") as cache_fptr:
+            pickle.dump(
+                ((CACHE_FORMAT, key), val),
+                cache_fptr,
+                protocol=pickle.HIGHEST_PROTOCOL,
+            )
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        logger.debug(f"Could not write cache file {cache_path}.")
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
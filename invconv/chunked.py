@@ -0,0 +1,302 @@
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+# Converts large sections by splitting them into ranges of rows that
+# are converted by separate worker processes. Only converting is done in
+# parallel, not reading: every section is read once, one row after the
+# other, by the main process, which hands the rows over to the workers
+# as they are read. Some of the values in
+# the output depend on every row before them:
+#
+# - importId counts the rows written so far (logic.import_id_incr).
+# - The number at the end of a code counts how many earlier rows
+#   had the same code (logic_func.used_code_nums and common.row_incr).
+# - A warning is given for product names that were already used
+#   (logic_func.used_product_names).
+#
+# Workers can't know any of that, so they leave a placeholder for codes,
+# record the product names they see and keep the messages they log.
+# Warnings are kept as well instead of being counted by the worker (see
+# msg_handler.warn()), so that they are only left out once there have
+# been enough of them in the whole conversion. Results are then merged
+# one range at a time in order of the rows, which fills in codes and
+# importId, warns about product names and logs the messages and warnings
+# of the workers. The output ends up the same as when every row is
+# converted one after the other.
+
+import collections
+import concurrent.futures
+import pickle
+import re
+
+from loguru import logger
+
+try:
+    import axm
+    import common
+    from exceptions import InvconvArgumentError
+    import logic
+    import logic_func
+    import msg_handler
+except ModuleNotFoundError:
+    import invconv.axm as axm
+    import invconv.common as common
+    from invconv.exceptions import InvconvArgumentError
+    import invconv.logic as logic
+    import invconv.logic_func as logic_func
+    import invconv.msg_handler as msg_handler
+
+# Number of rows given to a worker at a time.
+DEFAULT_CHUNK_ROWS = 50000
+
+# Left in the output by workers in place of a code. The characters are
+# in a Unicode private use area, so they shouldn't be found in any input.
+CODE_START = "\ue000"
+CODE_SEP = "\ue001"
+CODE_END = "\ue002"
+_code_re = re.compile(
+    re.escape(CODE_START)
+    + "(.*?)"
+    + re.escape(CODE_SEP)
+    + "([0-9]+)"
+    + re.escape(CODE_END),
+    re.DOTALL,
+)
+
+# Things that happened in a worker, in the order they happened.
+# row is a row written to the output, name is a product name that
+# was used, log is a message that was logged and warning is a
+# warning given through msg_handler.warn().
+EVENT_ROW = "row"
+EVENT_NAME = "name"
+EVENT_LOG = "log"
+EVENT_WARNING = "warning"
+
+# A range of rows of a single file-section pair (data_tuple),
+# as returned by data_tuple.rows().
+Chunk = collections.namedtuple("Chunk", ("data_tuple", "row_list"))
+
+# What a worker sends back once it is done with a chunk. report_dict
+# holds what the worker added to the report of msg_handler.
+ChunkResult = collections.namedtuple(
+    "ChunkResult", ("event_list", "num_cells", "report_dict")
+)
+
+# Everything that happened in the worker for the current chunk.
+_event_list = []
+
+
+class _ChunkSink:
+    def write_row(self, row):
+        _event_list.append((EVENT_ROW, row))
+
+
+# log_entry is the level, message and origin of a
+# message (see msg_handler.capture_log()).
+def _capture_log(log_entry):
+    _event_list.append((EVENT_LOG,) + log_entry)
+
+
+def _capture_warning(
+    kind, file_section, template, section_type, field_dict, origin_dict
+):
+    _event_list.append(
+        (
+            EVENT_WARNING,
+            kind,
+            file_section,
+            template,
+            section_type,
+            field_dict,
+            origin_dict,
+        )
+    )
+
+
+def _get_name(name):
+    _event_list.append((EVENT_NAME, name))
+    return name
+
+
+# The code is numbered as if this chunk was all there was.
+# That number is then increased during the merge.
+def _gen_code(cell_val):
+    code = logic_func.get_code_name(cell_val)
+    logic_func.number_code(code)
+    cur_val = logic_func.used_code_nums[code].cur_val
+    return CODE_START + code + CODE_SEP + str(cur_val) + CODE_END
+
+
+# Returns the functions set with axm.output.set_func() by whoever is
+# using the script (as opposed to the ones set by logic_func.py), which
+# a worker process doesn't set on its own.
+def get_custom_funcs():
+    return {
+        outcol: func
+        for outcol, func in axm.output.get_funcs().items()
+        if getattr(func, "__module__", None) != logic_func.__name__
+    }
+
+
+# Sets up a worker process with the data file, map file
+# and functions that were loaded by the main process.
+def _init_worker(data_dict, axm_state, func_dict, is_debug, error_policy):
+    common.is_debug = is_debug
+    msg_handler.error_policy = error_policy
+    common.import_data(data_dict)
+    axm.common.import_state(axm_state)
+    for outcol, func in func_dict.items():
+        axm.output.set_func(outcol, func)
+    msg_handler.capture_log(_capture_log)
+    msg_handler.warning_handler = _capture_warning
+    # Custom functions for the name and code are used as they are,
+    # so product names aren't checked and codes aren't numbered
+    # across chunks for them.
+    if axm.output.get_func("name") is logic_func.get_name:
+        axm.output.set_func("name", _get_name)
+    if axm.output.get_func("code") is logic_func.gen_code:
+        axm.output.set_func("code", _gen_code)
+    logic.set_sink(_ChunkSink())
+
+
+def _convert_chunk(chunk):
+    data_tuple = chunk.data_tuple
+    _event_list.clear()
+    msg_handler.reset_report()
+    logic_func.used_code_nums.clear()
+    logic.import_id_incr = 0
+    logic.pos_index = 0
+    common.row_incr = 0
+    common.csv_row.clear()
+    logic.init(data_tuple.filename, data_tuple.sectionname, data_tuple.headers)
+    num_cells = 0
+    for row in chunk.row_list:
+        for val in row:
+            logic.main(val)
+        num_cells += len(row)
+    return ChunkResult(list(_event_list), num_cells, msg_handler.get_report())
+
+
+# Reads every file-section pair and splits it into chunks of chunk_rows
+# rows. Rows are only read once the next chunk is needed.
+def get_chunks(data_list, chunk_rows=DEFAULT_CHUNK_ROWS):
+    for data_tuple in data_list:
+        row_list = []
+        num_chunks = 0
+        for row in data_tuple.rows():
+            row_list.append(row)
+            if len(row_list) >= chunk_rows:
+                yield Chunk(data_tuple, row_list)
+                num_chunks += 1
+                row_list = []
+        # A section without any rows still gets a chunk,
+        # the same as it still goes through logic.init().
+        if row_list or not num_chunks:
+            yield Chunk(data_tuple, row_list)
+
+
+# Puts the results of the workers together, one chunk at a time.
+class Merger:
+    def __init__(self, sink):
+        self.sink = sink
+        try:
+            self.import_id_index = common.csv_row.index("importId")
+        except KeyError:
+            self.import_id_index = None
+
+    def _fill_code(self, code_match):
+        code = code_match.group(1)
+        cur_val = int(code_match.group(2))
+        if code in self._code_offset_dict:
+            cur_val += self._code_offset_dict[code]
+        logic_func.used_code_nums[code] = logic_func.CodeTracker(
+            row_incr=common.row_incr, cur_val=cur_val
+        )
+        return logic_func.format_code(code, cur_val)
+
+    def merge(self, data_tuple, chunk_result):
+        common.file_name = data_tuple.filename
+        common.section_name = data_tuple.sectionname
+        # How much to add to the codes numbered by the worker,
+        # which is the number of rows that already used each code.
+        self._code_offset_dict = {
+            code: code_tracker.cur_val + 1
+            for code, code_tracker in logic_func.used_code_nums.items()
+        }
+        row_list = []
+        for event in chunk_result.event_list:
+            if event[0] == EVENT_ROW:
+                row = event[1]
+                for col_num, val in enumerate(row):
+                    if isinstance(val, str) and CODE_START in val:
+                        row[col_num] = _code_re.sub(self._fill_code, val)
+                logic.import_id_incr += 1
+                if self.import_id_index is not None:
+                    row[self.import_id_index] = logic.import_id_incr
+                common.row_incr += 1
+                row_list.append(row)
+            elif event[0] == EVENT_NAME:
+                logic_func.get_name(event[1])
+            elif event[0] == EVENT_WARNING:
+                message = msg_handler.add_warning(*event[1:6])
+                if message is not None:
+                    msg_handler.replay_log("WARNING", message, event[6])
+            else:
+                msg_handler.replay_log(*event[1:])
+        self.sink.write_rows(row_list)
+        msg_handler.add_report(chunk_result.report_dict)
+
+
+# Converts every file-section pair in data_list with num_jobs worker
+# processes and writes the result to sink. progress is called with
+# the file-section pair and number of cells of every chunk written.
+def run(data_list, sink, num_jobs, chunk_rows=DEFAULT_CHUNK_ROWS, progress=None):
+    func_dict = get_custom_funcs()
+    # The functions are sent to the workers by reference (module and
+    # name), which doesn't work for functions such as lambdas.
+    try:
+        pickle.dumps(func_dict)
+    except (pickle.PicklingError, AttributeError, TypeError):
+        logger.log(
+            "FAILURE",
+            "Functions set with axm.output.set_func() can't be sent to other "
+            "processes, so the conversion has to be done without --jobs.",
+        )
+        raise InvconvArgumentError
+    chunk_iter = get_chunks(data_list, chunk_rows)
+    merger = Merger(sink)
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=num_jobs,
+        mp_context=msg_handler.get_worker_context(),
+        initializer=_init_worker,
+        initargs=(
+            common.export_data(),
+            axm.common.export_state(),
+            func_dict,
+            common.is_debug,
+            # Workers can't ask the user anything.
+            msg_handler.get_error_policy(),
+        ),
+    ) as executor:
+        # Only a few chunks are read and handed out ahead of the one
+        # being merged, so that the input and finished chunks don't
+        # pile up in memory.
+        future_deque = collections.deque()
+        is_read = False
+        while not is_read or future_deque:
+            while not is_read and len(future_deque) < num_jobs * 2:
+                chunk = next(chunk_iter, None)
+                if chunk is None:
+                    is_read = True
+                    break
+                future_deque.append(
+                    (chunk.data_tuple, executor.submit(_convert_chunk, chunk))
+                )
+            if not future_deque:
+                break
+            data_tuple, future = future_deque.popleft()
+            chunk_result = future.result()
+            merger.merge(data_tuple, chunk_result)
+            if progress is not None:
+                file_section = (data_tuple.filename, data_tuple.sectionname)
+                progress(file_section, chunk_result.num_cells)
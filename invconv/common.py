@@ -1,12 +1,15 @@
 # Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
 # SPDX-license-identifier: 0BSD
 import collections
+import os
 import string
 
 try:
+    import cache
     from exceptions import InvconvUnsupportedDataFile
     import ini
 except ModuleNotFoundError:
+    import invconv.cache as cache
     from invconv.exceptions import InvconvUnsupportedDataFile
     import invconv.ini as ini
 
@@ -49,7 +52,85 @@ section_name = ""
 # of the number of rows outputted
 # (starting at zero).
 row_incr = 0
-csv_row = {}
+
+
+# Holds the values of the row currently being worked on. There is one
+# slot per Axelor column, and the same record is used for every row.
+# Columns can be looked up by name like a dictionary, but the index of
+# every column is only worked out once (in set_columns()).
+class RowRecord:
+    __slots__ = (
+        "columns",
+        "_index_dict",
+        "_blank_list",
+        "_val_list",
+        "_is_set_list",
+        "_set_count",
+    )
+
+    def __init__(self, columns=()):
+        self.set_columns(columns)
+
+    def set_columns(self, columns):
+        self.columns = tuple(columns)
+        self._index_dict = {column: index for index, column in enumerate(self.columns)}
+        # Columns that haven't been set are blank in the output.
+        self._blank_list = [""] * len(self.columns)
+        self._val_list = list(self._blank_list)
+        self._is_set_list = [False] * len(self.columns)
+        self._set_count = 0
+
+    def index(self, column):
+        return self._index_dict[column]
+
+    def set_at(self, index, val):
+        if not self._is_set_list[index]:
+            self._is_set_list[index] = True
+            self._set_count += 1
+        self._val_list[index] = val
+
+    def get_at(self, index):
+        return self._val_list[index]
+
+    def __setitem__(self, column, val):
+        # Like before, anything that isn't an Axelor
+        # column doesn't end up in the output.
+        if column in self._index_dict:
+            self.set_at(self._index_dict[column], val)
+
+    def __getitem__(self, column):
+        if column not in self:
+            raise KeyError(column)
+        return self._val_list[self._index_dict[column]]
+
+    def get(self, column, default=None):
+        if column not in self:
+            return default
+        return self._val_list[self._index_dict[column]]
+
+    def __contains__(self, column):
+        index = self._index_dict.get(column)
+        return index is not None and self._is_set_list[index]
+
+    # True if any column has been set.
+    def __bool__(self):
+        return self._set_count != 0
+
+    def __len__(self):
+        return self._set_count
+
+    def clear(self):
+        self._val_list[:] = self._blank_list
+        self._is_set_list[:] = [False] * len(self.columns)
+        self._set_count = 0
+
+    # Returns the values of all the columns in
+    # the same order as axelor_csv_columns.
+    def to_list(self):
+        return list(self._val_list)
+
+
+csv_row = RowRecord()
 
 
 def init(fptr):
@@ -70,6 +151,7 @@ def init(fptr):
     axcol_sect_name = string.Template("$type COLUMNS").substitute(type=axelor_csv_type)
     for key in data_parser[axcol_sect_name]:
         axelor_csv_columns[key] = data_parser[axcol_sect_name][key]
+    csv_row.set_columns(axelor_csv_columns)
     # Add all the sections in the data file into script, irregardless
     # of type, since each section needs a unique name anyway.
     # Section names should be lowercase, but not key names.
@@ -101,6 +183,81 @@ def init(fptr):
             constants[constant_name] = data_parser["CONSTANTS"].getuni(constant_name)
 
 
+# Same as init(), except the result of parsing the data file is
+# cached. As long as the data file hasn't changed, later runs only
+# need to read the cache.
+def load(data_file):
+    data_path = os.path.abspath(data_file)
+    data_stat = os.stat(data_path)
+    cache_key = (data_stat.st_mtime_ns, data_stat.st_size, SUPPORTED_FORMAT_VER)
+    cache_val = cache.load("ini", data_path, cache_key)
+    if cache_val is not None:
+        import_data(cache_val)
+        return
+    with open(data_file) as data_fptr:
+        init(data_fptr)
+    cache.store("ini", data_path, cache_key, export_data())
+
+
+# Returns everything init() got from the data file.
+# ArgTuple is converted into a regular tuple so that
+# it can be cached.
+def export_data():
+    return {
+        "axelor_csv_columns": axelor_csv_columns,
+        "axelor_csv_type": axelor_csv_type,
+        "meta_table": meta_table,
+        "constants": constants,
+        "fallback": fallback,
+        "arg_dict": {name: tuple(arg) for name, arg in arg_dict.items()},
+    }
+
+
+# The opposite of export_data().
+def import_data(data_dict):
+    global axelor_csv_type
+
+    axelor_csv_type = data_dict["axelor_csv_type"]
+    axelor_csv_columns.update(data_dict["axelor_csv_columns"])
+    csv_row.set_columns(axelor_csv_columns)
+    meta_table.update(data_dict["meta_table"])
+    constants.update(data_dict["constants"])
+    fallback.update(data_dict["fallback"])
+    for name, arg in data_dict["arg_dict"].items():
+        arg_dict[name] = ArgTuple(*arg)
+
+
+# Throws away everything from the last data file
+# and conversion so that another one can be done.
+def reset():
+    global axelor_csv_columns
+    global meta_table
+    global constants
+    global fallback
+    global arg_dict
+    global is_debug
+    global axelor_csv_type
+    global output_file_path
+    global file_name
+    global section_name
+    global row_incr
+    global csv_row
+
+    ini.reset()
+    axelor_csv_columns = {}
+    meta_table = {}
+    constants = {}
+    fallback = {}
+    arg_dict = {}
+    is_debug = False
+    axelor_csv_type = ""
+    output_file_path = ""
+    file_name = ""
+    section_name = ""
+    row_incr = 0
+    csv_row = RowRecord()
+
+
 def generate_help(target):
     target = target.lower().replace("_", " ").title()
     return f"Overrides the fallback value for {target}"
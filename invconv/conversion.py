@@ -0,0 +1,276 @@
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+# Lets the script be used as a library to do many conversions in the
+# same process, one after the other or from different threads. Everything
+# about a conversion is kept in module globals throughout the script, so a
+# Conversion keeps its own copy of those globals. They are put in place
+# whenever the conversion does some work and taken out again once it is
+# done. Conversions are serialized: only one of them does any work at a
+# time (while holding lock), although conversions in different threads
+# take turns after every batch of rows. Anything else that uses those
+# globals, such as main() in ax-invconv.py, holds lock while it does.
+
+import contextlib
+import hashlib
+import itertools
+import os
+import threading
+
+try:
+    import axm
+    import builtin_types
+    import cache
+    import common
+    from exceptions import InvconvArgumentError
+    import ftype
+    import ini
+    import logic
+    import logic_func
+    import metrics
+    import msg_handler
+    import sink
+    import xlsx
+except ModuleNotFoundError:
+    import invconv.axm as axm
+    import invconv.builtin_types as builtin_types
+    import invconv.cache as cache
+    import invconv.common as common
+    from invconv.exceptions import InvconvArgumentError
+    import invconv.ftype as ftype
+    import invconv.ini as ini
+    import invconv.logic as logic
+    import invconv.logic_func as logic_func
+    import invconv.metrics as metrics
+    import invconv.msg_handler as msg_handler
+    import invconv.sink as sink
+    import invconv.xlsx as xlsx
+
+# Number of input rows converted before
+# letting another conversion have a turn.
+DEFAULT_BATCH_ROWS = 256
+
+# Held by whatever currently has the globals of a conversion in place.
+lock = threading.RLock()
+
+# The module globals that belong to a single conversion.
+_STATE_NAMES = (
+    (
+        common,
+        (
+            "axelor_csv_columns",
+            "meta_table",
+            "constants",
+            "fallback",
+            "arg_dict",
+            "is_debug",
+            "axelor_csv_type",
+            "output_file_path",
+            "file_name",
+            "section_name",
+            "row_incr",
+            "csv_row",
+        ),
+    ),
+    (ini, ("data_parser",)),
+    (logic, ("input_header_list", "pos_index", "import_id_incr", "_sink")),
+    (logic_func, ("used_product_names", "used_code_nums")),
+    (msg_handler, ("_warning_dict", "_skipped_list", "_cell_list")),
+    (xlsx, ("xlsx_data_list", "xlsx_tuple_list")),
+    (axm.output, ("_FUNCTION_MAP",)),
+    (
+        axm.common,
+        (
+            "cur_file",
+            "cur_sect",
+            "used_files",
+            "used_sect",
+            "opt_dict",
+            "out_input_col",
+            "column_output_dict",
+            "del_dict",
+            "avoid_list",
+            "input_col_dict",
+            "version_checked",
+            "valid_col_dict",
+            "_file_section_set",
+            "_file_section_ver",
+            "_avoid_list_len",
+            "_file_name_index",
+            "_sect_name_index",
+            "_file_name_cache",
+            "_sect_name_cache",
+            "_file_sect_cache",
+            "_name_index_ver",
+            "compiled_output_dict",
+            "_header_index_dict",
+        ),
+    ),
+    (axm.parser, ("_is_scheduled",)),
+    (axm.scheduler, ("_nice_dict", "_nice_list")),
+    (axm.utils, ("stream_pos",)),
+    (cache, ("is_enabled",)),
+)
+
+
+# Throws away the state of the last conversion, so that
+# a new one can be started. (The cache stays enabled or
+# disabled, since it isn't part of a single conversion.)
+def reset():
+    common.reset()
+    logic.reset()
+    logic_func.reset()
+    msg_handler.reset_warnings()
+    msg_handler.reset_report()
+    xlsx.reset()
+    axm.common.reset()
+    axm.output.reset()
+    axm.parser.reset()
+    axm.scheduler.reset()
+    axm.utils.reset()
+
+
+def get_state():
+    return [
+        getattr(module, name)
+        for module, name_tuple in _STATE_NAMES
+        for name in name_tuple
+    ]
+
+
+def set_state(state_list):
+    state_iter = iter(state_list)
+    for module, name_tuple in _STATE_NAMES:
+        for name in name_tuple:
+            setattr(module, name, next(state_iter))
+
+
+# Parses and finalizes the map file, unless the result of
+# doing so with the same map file and the same input headers
+# has already been cached.
+def compile_map(map_file, header_dict):
+    axm.parser.init(header_dict)
+    with open(map_file, "rb") as map_fptr:
+        map_hash = hashlib.sha256(map_fptr.read())
+    # How file names given in the map file are matched
+    # depends on the current directory.
+    header_signature = (os.getcwd(), list(header_dict.items()))
+    map_hash.update(repr(header_signature).encode("utf-8", "surrogatepass"))
+    # So do the operators and commands, which can be added to
+    # (such as by a script using this as a library).
+    registry_signature = (axm.operator.get_signature(), axm.command.get_signature())
+    map_hash.update(repr(registry_signature).encode("utf-8", "surrogatepass"))
+    cache_name = map_hash.hexdigest()
+    cache_key = str(axm.common.SUPPORTED_AXM_VER)
+    axm_state = cache.load("axm", cache_name, cache_key)
+    if axm_state is not None:
+        axm.common.import_state(axm_state)
+        return
+    with metrics.stage("parse"), open(map_file) as map_fptr:
+        axm.parser.parse(map_fptr)
+    with metrics.stage("finalize"):
+        axm.parser.finalize()
+    cache.store("axm", cache_name, cache_key, axm.common.export_state())
+
+
+# A single conversion of input files to Axelor rows. fallback_dict
+# replaces the default fallback values in the data file and is indexed
+# by the name of the section (for example, "axelor_units").
+class Conversion:
+    def __init__(
+        self,
+        inputs,
+        map_file="default.axm",
+        data_file="demo.ini",
+        file_type=None,
+        fallback_dict=None,
+        use_cache=True,
+        batch_rows=DEFAULT_BATCH_ROWS,
+    ):
+        self.inputs = list(inputs)
+        self.map_file = map_file
+        self.data_file = data_file
+        self.file_type = file_type
+        self.fallback_dict = fallback_dict or {}
+        self.use_cache = use_cache
+        self.batch_rows = batch_rows
+        # The names of the output columns and the Axelor
+        # CSV type (such as "PRODUCT"), once started.
+        self.columns = None
+        self.csv_type = None
+        self.data_list = None
+        self._state = None
+        self._row_buffer = sink.RowBuffer()
+
+    # Puts the globals of this conversion in place for
+    # the duration of the with statement.
+    @contextlib.contextmanager
+    def activate(self):
+        with lock:
+            outside_state = get_state()
+            if self._state is None:
+                reset()
+            else:
+                set_state(self._state)
+            try:
+                yield self
+            finally:
+                self._state = get_state()
+                set_state(outside_state)
+
+    # Loads the data file, input files and map file.
+    def start(self):
+        if self.data_list is not None:
+            return
+        with self.activate():
+            cache.is_enabled = self.use_cache
+            common.load(self.data_file)
+            for section_name, fallback_val in self.fallback_dict.items():
+                if fallback_val not in common.meta_table.get(section_name, ()):
+                    raise InvconvArgumentError
+                common.fallback[section_name] = fallback_val
+            file_type = self.file_type
+            if file_type is None:
+                file_type = ftype.get_default()
+            self.data_list = ftype.get_func(file_type)(self.inputs)
+            compile_map(self.map_file, self.data_list.headers())
+            self.columns = list(common.axelor_csv_columns)
+            self.csv_type = common.axelor_csv_type
+            logic.set_sink(self._row_buffer)
+
+    # Returns the output rows (without the header) one at a time.
+    def rows(self):
+        self.start()
+        for data_tuple in self.data_list:
+            row_iter = data_tuple.rows()
+            is_done = False
+            while not is_done:
+                with self.activate():
+                    logic.init(
+                        data_tuple.filename, data_tuple.sectionname, data_tuple.headers
+                    )
+                    num_rows = 0
+                    for row in itertools.islice(row_iter, self.batch_rows):
+                        for val in row:
+                            logic.main(val)
+                        num_rows += 1
+                    is_done = num_rows < self.batch_rows
+                    row_list = self._row_buffer.take()
+                yield from row_list
+        with self.activate():
+            msg_handler.flush_warnings()
+
+    __iter__ = rows
+
+
+# Converts inputs and returns an iterator over the output rows,
+# starting with the header (unless header is False). The rows are
+# the same as what would be in the CSV file made by the script.
+def convert(
+    inputs, map_file="default.axm", data_file="demo.ini", header=True, **settings
+):
+    conversion = Conversion(inputs, map_file, data_file, **settings)
+    conversion.start()
+    if header:
+        yield list(conversion.columns)
+    yield from conversion.rows()
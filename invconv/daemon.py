@@ -0,0 +1,229 @@
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+# Keeps a process running that converts files whenever it is asked to,
+# so that starting Python, importing everything and loading the data
+# file and map file only happens once. Jobs are sent over a Unix domain
+# socket as a single line of JSON:
+#
+#   {"inputs": ["/path/to/inventory.xlsx"], "map_file": "/path/to/map.axm",
+#    "data_file": "/path/to/demo.ini", "file_type": "xlsx",
+#    "fallback": {"axelor_units": "Unit"}}
+#
+# Only "inputs" is needed. Paths should be absolute, as the daemon
+# doesn't know the current directory of whoever sent the job (submit()
+# makes them absolute). File names in a map file (after FILE:) that are
+# relative paths are matched against the current directory of the daemon,
+# not of whoever sent the job, so a map file used through the daemon
+# should only use the names of files or absolute paths. The reply
+# is a series of frames, each made of a kind (one byte), the length of
+# the data (four bytes, big-endian) and the data itself:
+#
+#   D  part of the CSV output (UTF-8)
+#   T  how long the job took, as JSON (always the last frame)
+#   E  what went wrong (UTF-8, always the last frame)
+
+import csv
+import io
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import threading
+import time
+
+from loguru import logger
+
+# Sending a job doesn't need anything used for converting,
+# so that is only imported by serve().
+try:
+    import cache
+    from exceptions import InvconvArgumentError, InvconvDaemonError
+    import msg_handler
+except ModuleNotFoundError:
+    import invconv.cache as cache
+    from invconv.exceptions import InvconvArgumentError, InvconvDaemonError
+    import invconv.msg_handler as msg_handler
+
+FRAME_DATA = b"D"
+FRAME_TIMING = b"T"
+FRAME_ERROR = b"E"
+_frame_header = struct.Struct(">cI")
+
+# Number of rows sent in each data frame.
+ROWS_PER_FRAME = 256
+# Longest job request accepted (in bytes).
+MAX_REQUEST_LEN = 1 << 20
+
+
+def send_frame(sock_file, kind, data):
+    sock_file.write(_frame_header.pack(kind, len(data)))
+    sock_file.write(data)
+
+
+# Returns (kind, data), or None if the other side is done.
+def recv_frame(sock_file):
+    header = sock_file.read(_frame_header.size)
+    if not header:
+        return None
+    if len(header) != _frame_header.size:
+        raise InvconvDaemonError("reply was cut short")
+    kind, data_len = _frame_header.unpack(header)
+    data = sock_file.read(data_len)
+    if len(data) != data_len:
+        raise InvconvDaemonError("reply was cut short")
+    return kind, data
+
+
+class _JobHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        start_time = time.perf_counter()
+        request = self.rfile.readline(MAX_REQUEST_LEN)
+        # Nothing is sent when checking whether the daemon is running
+        # (see _remove_stale_socket()).
+        if not request:
+            return
+        try:
+            job_dict = json.loads(request)
+            job = self.server.conversion.Conversion(
+                job_dict["inputs"],
+                map_file=job_dict.get("map_file", self.server.map_file),
+                data_file=job_dict.get("data_file", self.server.data_file),
+                file_type=job_dict.get("file_type"),
+                fallback_dict=job_dict.get("fallback"),
+                use_cache=self.server.use_cache,
+            )
+            job.start()
+            load_time = time.perf_counter()
+            num_rows = self._send_rows(job)
+        except Exception as job_error:
+            # A job failing doesn't stop the daemon.
+            logger.opt(exception=job_error).log("FAILURE", "Conversion job failed.")
+            self._send_last_frame(FRAME_ERROR, str(job_error).encode("utf-8"))
+            return
+        end_time = time.perf_counter()
+        timing_dict = {
+            "load": load_time - start_time,
+            "convert": end_time - load_time,
+            "total": end_time - start_time,
+            "rows": num_rows,
+        }
+        self._send_last_frame(FRAME_TIMING, json.dumps(timing_dict).encode("utf-8"))
+
+    def _send_last_frame(self, kind, data):
+        try:
+            send_frame(self.wfile, kind, data)
+        except OSError as send_error:
+            # Whoever sent the job is already gone,
+            # which doesn't stop the daemon either.
+            logger.warning(f"Couldn't send the reply to a job: {send_error}")
+
+    def _send_rows(self, job):
+        csv_buffer = io.StringIO(newline="")
+        csv_out = csv.writer(csv_buffer, dialect="excel")
+        csv_out.writerow(job.columns)
+        num_rows = 0
+        for row in job.rows():
+            csv_out.writerow(row)
+            num_rows += 1
+            if num_rows % ROWS_PER_FRAME == 0:
+                self._send_csv(csv_buffer)
+        self._send_csv(csv_buffer)
+        return num_rows
+
+    def _send_csv(self, csv_buffer):
+        csv_data = csv_buffer.getvalue()
+        if csv_data:
+            send_frame(self.wfile, FRAME_DATA, csv_data.encode("utf-8"))
+        csv_buffer.seek(0)
+        csv_buffer.truncate()
+
+
+class _JobServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _stop(signum, frame):
+    raise SystemExit(0)
+
+
+# Removes the socket left behind by a daemon that is no longer running.
+# Anything else found at socket_path, such as a regular file or the socket
+# of a daemon that is still running, is left alone and the daemon doesn't
+# start.
+def _remove_stale_socket(socket_path):
+    try:
+        path_stat = os.stat(socket_path)
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(path_stat.st_mode):
+        logger.log("FAILURE", f"{socket_path} already exists and isn't a socket.")
+        raise InvconvArgumentError
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        try:
+            sock.connect(socket_path)
+        except ConnectionRefusedError:
+            os.remove(socket_path)
+            return
+        except OSError as connect_error:
+            logger.log("FAILURE", f"Couldn't check {socket_path}: {connect_error}")
+            raise InvconvArgumentError
+    logger.log("FAILURE", f"A daemon is already listening on {socket_path}.")
+    raise InvconvArgumentError
+
+
+# Converts jobs sent to socket_path until stopped. map_file and data_file
+# are used for jobs that don't give their own. Unless use_cache is set,
+# jobs don't use the cache (see cache.py).
+def serve(socket_path, map_file="default.axm", data_file="demo.ini", use_cache=True):
+    try:
+        import conversion
+    except ModuleNotFoundError:
+        import invconv.conversion as conversion
+
+    # Data and map files stay loaded between jobs.
+    cache.keep_in_memory = True
+    # Nobody is there to answer any questions, so
+    # jobs fail instead of waiting on an answer.
+    if msg_handler.get_error_policy() == msg_handler.POLICY_PROMPT:
+        msg_handler.error_policy = msg_handler.POLICY_FAIL
+    _remove_stale_socket(socket_path)
+    # Being stopped by SIGTERM still removes the socket.
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, _stop)
+    with _JobServer(socket_path, _JobHandler) as server:
+        server.conversion = conversion
+        server.map_file = os.path.abspath(map_file)
+        server.data_file = os.path.abspath(data_file)
+        server.use_cache = use_cache
+        logger.info(f"Waiting for conversion jobs on {socket_path}.")
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(socket_path)
+
+
+# Sends a job to the daemon listening on socket_path and writes the CSV
+# output to output_fptr. Returns the timing information of the job.
+def submit(socket_path, inputs, output_fptr, **job_dict):
+    job_dict["inputs"] = [os.path.abspath(input_file) for input_file in inputs]
+    for path_key in ("map_file", "data_file"):
+        if job_dict.get(path_key):
+            job_dict[path_key] = os.path.abspath(job_dict[path_key])
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        with sock.makefile("rwb") as sock_file:
+            sock_file.write(json.dumps(job_dict).encode("utf-8") + b"\n")
+            sock_file.flush()
+            while (frame := recv_frame(sock_file)) is not None:
+                kind, data = frame
+                if kind == FRAME_DATA:
+                    output_fptr.write(data.decode("utf-8"))
+                elif kind == FRAME_TIMING:
+                    return json.loads(data)
+                elif kind == FRAME_ERROR:
+                    raise InvconvDaemonError(data.decode("utf-8"))
+    raise InvconvDaemonError("no reply was given")
@@ -27,3 +27,15 @@ class InvconvUnsupportedDataFile(InvconvException):
     def __init__(self, ver_found, ver_expect):
         self.message = f"Expected version {ver_expect}, but got {ver_found} instead"
         super().__init__(self.message)
+
+
+class InvconvStopped(InvconvException):
+    def __init__(self, reason):
+        self.message = f"The conversion was stopped: {reason}"
+        super().__init__(self.message)
+
+
+class InvconvDaemonError(InvconvException):
+    def __init__(self, reason):
+        self.message = f"The conversion daemon failed: {reason}"
+        super().__init__(self.message)
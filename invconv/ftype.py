@@ -112,6 +112,24 @@ class BasicFtypeDataClass:
     # Have __repr__ render the same as __str__.
     __repr__ = lambda self: self.__str__()
 
+    # Returns every row as a list of str values, one for each
+    # header. Subclasses can replace this with something faster,
+    # since this goes through parser() one value at a time.
+    # min_row and max_row are counted from the first row after the
+    # headers (starting at 0) and max_row is excluded.
+    def rows(self, min_row=None, max_row=None):
+        row_num = 0
+        row_list = []
+        while (parser_result := self.parser()) is not None:
+            row_list.append(parser_result)
+            if len(row_list) == len(self.headers):
+                if (min_row is None or row_num >= min_row) and (
+                    max_row is None or row_num < max_row
+                ):
+                    yield row_list
+                row_num += 1
+                row_list = []
+
     def __eq__(self, obj):
         # Check if an attribute in obj
         # matches filename and sectionname.
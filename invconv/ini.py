@@ -13,14 +13,26 @@ def universal_get(string):
     return return_val
 
 
-data_parser = configparser.RawConfigParser(
-    allow_no_value=False,
-    delimiters=["="],
-    comment_prefixes=["#"],
-    strict=True,
-    empty_lines_in_values=True,
-    default_section=None,
-    interpolation=None,
-    converters={"uni": universal_get},
-)
-data_parser.optionxform = lambda option: option
+def new_data_parser():
+    parser = configparser.RawConfigParser(
+        allow_no_value=False,
+        delimiters=["="],
+        comment_prefixes=["#"],
+        strict=True,
+        empty_lines_in_values=True,
+        default_section=None,
+        interpolation=None,
+        converters={"uni": universal_get},
+    )
+    parser.optionxform = lambda option: option
+    return parser
+
+
+data_parser = new_data_parser()
+
+
+# A data file can only be read once by data_parser,
+# so a new one is needed to read another one.
+def reset():
+    global data_parser
+    data_parser = new_data_parser()
@@ -20,6 +20,17 @@ input_header_list = []
 pos_index = 0
 
 
+def reset():
+    global input_header_list
+    global pos_index
+    global import_id_incr
+    global _sink
+    input_header_list = []
+    pos_index = 0
+    import_id_incr = 0
+    _sink = None
+
+
 def init(file_name, section_name, header_list):
     global input_header_list
     common.file_name = file_name
@@ -33,13 +44,16 @@ def main(val):
     if val is not None:
         # Force val to be string.
         str_val = str(val)
-    for header in common.axelor_csv_columns:
-        input_col = input_header_list[pos_index]
+    input_col = input_header_list[pos_index]
+    for header_index, header in enumerate(common.csv_row.columns):
         if axm.output.is_valid_input_col(
             (common.file_name, common.section_name), header, input_col
         ):
-            common.csv_row[header] = axm.output.string(
-                (common.file_name, common.section_name), header, str_val
+            common.csv_row.set_at(
+                header_index,
+                axm.output.string(
+                    (common.file_name, common.section_name), header, str_val
+                ),
             )
     max_pos = len(input_header_list) - 1
     if pos_index == max_pos:
@@ -55,14 +69,39 @@ def main(val):
         pos_index += 1
 
 
-def commit_headers():
-    if isinstance(common.output_file_path, str):
+# Where finished rows are written to. If no sink is set,
+# common.output_file_path is opened for every row.
+_sink = None
+
+
+def set_sink(sink):
+    global _sink
+    _sink = sink
+
+
+def get_sink():
+    return _sink
+
+
+def _write_row(row):
+    if _sink is not None:
+        _sink.write_row(row)
+    elif isinstance(common.output_file_path, str):
         with open(common.output_file_path, "a", newline="") as fptr:
             csv_out = csv.writer(fptr, dialect="excel")
-            csv_out.writerow(common.axelor_csv_columns)
+            csv_out.writerow(row)
     else:
         csv_out = csv.writer(common.output_file_path, dialect="excel")
-        csv_out.writerow(common.axelor_csv_columns)
+        csv_out.writerow(row)
+
+
+# A sink that is given the header has to have write_header()
+# (see sink.py), since it can be handled differently from a row.
+def commit_headers():
+    if _sink is not None:
+        _sink.write_header(common.axelor_csv_columns)
+    else:
+        _write_row(common.axelor_csv_columns)
 
 
 import_id_incr = 0
@@ -77,21 +116,7 @@ def commit_row():
     import_id_incr += 1
     common.csv_row["importId"] = import_id_incr
 
-    # Make sure all undefined columns are blank.
-    for ax_column in common.axelor_csv_columns:
-        if ax_column not in common.csv_row:
-            common.csv_row[ax_column] = ""
-
-    # Enforce a consistant ordering.
-    row_list = []
-    for ax_column in common.axelor_csv_columns:
-        row_list.append(common.csv_row[ax_column])
-
-    if isinstance(common.output_file_path, str):
-        with open(common.output_file_path, "a", newline="") as fptr:
-            csv_out = csv.writer(fptr, dialect="excel")
-            csv_out.writerow(row_list)
-    else:
-        csv_out = csv.writer(common.output_file_path, dialect="excel")
-        csv_out.writerow(row_list)
+    # Undefined columns are already blank, and csv_row
+    # is always in the same order as axelor_csv_columns.
+    _write_row(common.csv_row.to_list())
     common.csv_row.clear()
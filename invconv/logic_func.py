@@ -6,8 +6,6 @@
 import collections
 import string
 
-from loguru import logger
-
 try:
     import axm
     import common
@@ -25,13 +23,11 @@ used_product_names = set()
 def get_name(name):
     global used_product_names
     if name in used_product_names:
-        logger.warning(
-            string.Template(
-                'Product name "$name" has already been defined in $id.'
-            ).substitute(
-                name=name,
-                id=msg_handler.get_id((common.file_name, common.section_name)),
-            )
+        msg_handler.warn(
+            "duplicate name",
+            (common.file_name, common.section_name),
+            'Product name "$name" has already been defined in $id.',
+            name=name,
         )
     used_product_names.add(name)
     return name
@@ -85,8 +81,20 @@ used_code_nums = {}
 CodeTracker = collections.namedtuple("CodeTracker", ("row_incr", "cur_val"))
 
 
-def gen_code(cell_val):
+# Forgets the product names and codes used so far.
+def reset():
+    global used_product_names
     global used_code_nums
+    used_product_names = set()
+    used_code_nums = {}
+
+
+def gen_code(cell_val):
+    return number_code(get_code_name(cell_val))
+
+
+# Gets the part of the code that comes before the number.
+def get_code_name(cell_val):
     code = ""
     cat_id = get_cat_id(cell_val)
     cat = ""
@@ -119,6 +127,11 @@ def gen_code(cell_val):
             code = "INVCONV"
         else:
             code = common.csv_row["name"].upper().replace(" ", "_")
+    return code
+
+
+def number_code(code):
+    global used_code_nums
     # Start cur_val at zero.
     if code not in used_code_nums:
         used_code_nums[code] = CodeTracker(row_incr=common.row_incr, cur_val=0)
@@ -128,11 +141,14 @@ def gen_code(cell_val):
         used_code_nums[code] = CodeTracker(
             row_incr=common.row_incr, cur_val=used_code_nums[code].cur_val + 1
         )
+    return format_code(code, used_code_nums[code].cur_val)
+
+
+def format_code(code, cur_val):
     # A list is used to make code more portable.
     tmp_code_list = [code, "-"]
     # cur_val starting at zero is used in code.
     # Numbers under 1000 are prepended with zeros.
-    cur_val = used_code_nums[code].cur_val
     if cur_val >= 1000:
         pass
     elif cur_val >= 100:
@@ -227,13 +243,11 @@ def get_price(cell_val):
     # price.
     price_str = "".join(price_list)
     if not price_str:
-        logger.warning(
-            string.Template(
-                'Cell in $id has "$val" and not cost. Defaulting to 0.00.'
-            ).substitute(
-                id=msg_handler.get_id((common.file_name, common.section_name)),
-                val=cell_val,
-            )
+        msg_handler.warn(
+            "missing price",
+            (common.file_name, common.section_name),
+            'Cell in $id has "$val" and not cost. Defaulting to 0.00.',
+            val=cell_val,
         )
         price_str = "0.00"
     return price_str
@@ -0,0 +1,308 @@
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+# Records how long each stage of a conversion takes (loading the data
+# file, reading the input files, compiling the map file, converting and
+# writing), in wall time and CPU time, along with how many rows and
+# cells went through it. The conversion is also broken down by
+# file-section pair. Nothing is recorded unless is_enabled is set, so
+# converting without --metrics isn't slowed down.
+#
+# The CPU time is only that of the thread running the conversion, not
+# the whole process. With --pipeline, the convert stage and every
+# file-section pair therefore leave out the time spent by the reader and
+# transform threads, and with --jobs, the time spent by the worker
+# processes. The write stage is always done by the thread running the
+# conversion, so the time of other threads doesn't end up in it.
+#
+# Memory use can be recorded as well (with --memtrace), using tracemalloc
+# snapshots taken whenever a stage starts and ends. For every stage, this
+# gives the most memory that was used in total while it ran (peak), how
+# much more is used after it is done (retained) and where that memory
+# was allocated. tracemalloc is only imported once memory is traced.
+
+import contextlib
+import json
+import time
+
+from loguru import logger
+
+# Only record anything if set.
+is_enabled = False
+
+# Number of allocation sites listed for every stage.
+NUM_ALLOC_SITES = 10
+
+
+class StageStats:
+    __slots__ = ("wall", "cpu", "rows", "cells", "calls")
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.rows = 0
+        self.cells = 0
+        self.calls = 0
+
+    def add(self, wall, cpu, rows=0, cells=0):
+        self.wall += wall
+        self.cpu += cpu
+        self.rows += rows
+        self.cells += cells
+        self.calls += 1
+
+    def to_dict(self):
+        stats_dict = {
+            "wall_time": self.wall,
+            "cpu_time": self.cpu,
+            "rows": self.rows,
+            "cells": self.cells,
+            "calls": self.calls,
+            "rows_per_sec": None,
+            "cells_per_sec": None,
+        }
+        if self.wall > 0:
+            stats_dict["rows_per_sec"] = self.rows / self.wall
+            stats_dict["cells_per_sec"] = self.cells / self.wall
+        return stats_dict
+
+
+# Indexed by the name of the stage, in the order they first ran.
+_stage_dict = {}
+# Indexed by file-section pair.
+_section_dict = {}
+# Rows written since progress() was last called.
+_pending_rows = 0
+# Wall time and CPU time when progress() was last called.
+_section_mark = (0.0, 0.0)
+
+
+def reset():
+    global _pending_rows
+    global _section_mark
+    _stage_dict.clear()
+    _section_dict.clear()
+    _pending_rows = 0
+    _section_mark = (0.0, 0.0)
+    _memory_dict.clear()
+    _memory_list.clear()
+    if _is_tracing:
+        _stop_tracing()
+
+
+def _get_stats(stats_dict, key):
+    stats = stats_dict.get(key)
+    if stats is None:
+        stats = stats_dict[key] = StageStats()
+    return stats
+
+
+def add(name, wall, cpu, rows=0, cells=0):
+    _get_stats(_stage_dict, name).add(wall, cpu, rows, cells)
+
+
+# Times everything in the with statement as the stage called name.
+# If sections is set, the stage is also broken down by file-section
+# pair (through progress()) and its rows and cells are the total of
+# every file-section pair.
+@contextlib.contextmanager
+def stage(name, sections=False):
+    global _section_mark
+    if not is_enabled:
+        yield
+        return
+    if _is_tracing:
+        _enter_memory()
+    start_wall = time.perf_counter()
+    start_cpu = time.thread_time()
+    if sections:
+        _section_mark = (start_wall, start_cpu)
+        old_section_dict = {
+            file_section: (stats.rows, stats.cells)
+            for file_section, stats in _section_dict.items()
+        }
+    try:
+        yield
+    finally:
+        num_rows = 0
+        num_cells = 0
+        if sections:
+            for file_section, stats in _section_dict.items():
+                old_rows, old_cells = old_section_dict.get(file_section, (0, 0))
+                num_rows += stats.rows - old_rows
+                num_cells += stats.cells - old_cells
+        add(
+            name,
+            time.perf_counter() - start_wall,
+            time.thread_time() - start_cpu,
+            num_rows,
+            num_cells,
+        )
+        if _is_tracing:
+            _exit_memory(name)
+
+
+# Memory use of every stage, indexed by the name of the stage.
+_memory_dict = {}
+# Stages that are currently running, each as a list of the snapshot
+# taken when it started and the peak memory use of any stages that
+# ran (and finished) inside of it.
+_memory_list = []
+# Set while memory is being traced.
+_is_tracing = False
+
+
+def _take_snapshot():
+    import tracemalloc
+
+    snapshot = tracemalloc.take_snapshot()
+    # Memory used by tracemalloc itself isn't counted.
+    return snapshot.filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+
+
+def start_memory_trace():
+    global _is_tracing
+    import tracemalloc
+
+    tracemalloc.start()
+    _is_tracing = True
+
+
+def _stop_tracing():
+    global _is_tracing
+    import tracemalloc
+
+    tracemalloc.stop()
+    _is_tracing = False
+
+
+def _enter_memory():
+    import tracemalloc
+
+    if _memory_list:
+        # Resetting the peak for the new stage would lose the
+        # peak of the stage that is already running.
+        _memory_list[-1][1] = max(
+            _memory_list[-1][1], tracemalloc.get_traced_memory()[1]
+        )
+    snapshot = _take_snapshot()
+    tracemalloc.reset_peak()
+    _memory_list.append([snapshot, 0])
+
+
+def _exit_memory(name):
+    import tracemalloc
+
+    peak_size = tracemalloc.get_traced_memory()[1]
+    start_snapshot, child_peak = _memory_list.pop()
+    peak_size = max(peak_size, child_peak)
+    if _memory_list:
+        _memory_list[-1][1] = max(_memory_list[-1][1], peak_size)
+    end_snapshot = _take_snapshot()
+    start_size = sum(trace.size for trace in start_snapshot.traces)
+    end_size = sum(trace.size for trace in end_snapshot.traces)
+    site_list = []
+    for stat_diff in end_snapshot.compare_to(start_snapshot, "lineno"):
+        if len(site_list) >= NUM_ALLOC_SITES:
+            break
+        if stat_diff.size_diff <= 0:
+            continue
+        frame = stat_diff.traceback[0]
+        site_list.append(
+            {
+                "site": f"{frame.filename}:{frame.lineno}",
+                "size": stat_diff.size_diff,
+                "count": stat_diff.count_diff,
+            }
+        )
+    memory_dict = _memory_dict.setdefault(name, {"peak": 0, "retained": 0})
+    memory_dict["peak"] = max(memory_dict["peak"], peak_size)
+    memory_dict["retained"] += end_size - start_size
+    memory_dict["alloc_sites"] = site_list
+
+
+# Stops tracing memory and logs what was recorded.
+def stop_memory_trace():
+    _stop_tracing()
+    for name, memory_dict in _memory_dict.items():
+        line_list = [
+            f"Memory use of stage {name}: peak {memory_dict['peak'] / 1024:.1f} KiB,"
+            f" retained {memory_dict['retained'] / 1024:.1f} KiB"
+        ]
+        for site_dict in memory_dict["alloc_sites"]:
+            line_list.append(
+                f"    {site_dict['size'] / 1024:10.1f} KiB in {site_dict['count']}"
+                f" blocks at {site_dict['site']}"
+            )
+        logger.info("\n".join(line_list))
+
+
+# Called once num_cells cells of file_section have been converted. The
+# rows written and time taken since the last call are counted towards
+# file_section.
+def progress(file_section, num_cells):
+    global _pending_rows
+    global _section_mark
+    cur_wall = time.perf_counter()
+    cur_cpu = time.thread_time()
+    mark_wall, mark_cpu = _section_mark
+    _get_stats(_section_dict, file_section).add(
+        cur_wall - mark_wall, cur_cpu - mark_cpu, _pending_rows, num_cells
+    )
+    _pending_rows = 0
+    _section_mark = (cur_wall, cur_cpu)
+
+
+# Passes rows on to sink while timing how long writing takes
+# (as the "write" stage) and counting the rows written.
+class MeteredSink:
+    def __init__(self, sink, name="write"):
+        self.sink = sink
+        self.name = name
+
+    def _add(self, start_wall, start_cpu, num_rows):
+        global _pending_rows
+        _pending_rows += num_rows
+        add(
+            self.name,
+            time.perf_counter() - start_wall,
+            time.thread_time() - start_cpu,
+            rows=num_rows,
+        )
+
+    def write_row(self, row):
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        self.sink.write_row(row)
+        self._add(start_wall, start_cpu, 1)
+
+    def write_rows(self, rows):
+        start_wall = time.perf_counter()
+        start_cpu = time.thread_time()
+        rows = list(rows)
+        self.sink.write_rows(rows)
+        self._add(start_wall, start_cpu, len(rows))
+
+    def close(self):
+        self.sink.close()
+
+
+def get_report():
+    return {
+        "stages": {name: stats.to_dict() for name, stats in _stage_dict.items()},
+        "sections": [
+            {"file": file_name, "section": section_name, **stats.to_dict()}
+            for (file_name, section_name), stats in _section_dict.items()
+        ],
+        "memory": _memory_dict,
+    }
+
+
+# Writes what has been recorded to metrics_path as JSON. Anything in
+# info_dict (such as the version of the script) is written along with it.
+def write(metrics_path, info_dict=None):
+    report_dict = dict(info_dict or {})
+    report_dict.update(get_report())
+    with open(metrics_path, "w") as metrics_fptr:
+        json.dump(report_dict, metrics_fptr, indent=2)
+        metrics_fptr.write("\n")
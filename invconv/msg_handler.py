@@ -1,16 +1,21 @@
 # Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
 # SPDX-license-identifier: 0BSD
 
+import json
 import os
+import string
 import sys
+import threading
 import time
 
 from loguru import logger
 
 try:
     import common
+    from exceptions import InvconvStopped
 except ModuleNotFoundError:
     import invconv.common as common
+    from invconv.exceptions import InvconvStopped
 
 # Default log handler
 # (included with loguru)
@@ -34,11 +39,36 @@ def _lev_filter(lev):
     return _filter
 
 
+# Handlers added by init() and set_log(), which get
+# removed if init() is run again.
+_handler_id_list = []
+
+
+def _add_handler(*args, **kwargs):
+    _handler_id_list.append(logger.add(*args, **kwargs))
+
+
+# Errors resulting from other (non-fatal) errors
+# corresponds to a new level: failure.
+# (It is only defined once, however many times this is run.)
+def add_levels():
+    try:
+        logger.level("FAILURE")
+    except ValueError:
+        logger.level("FAILURE", no=35, color="<red>", icon="!")
+
+
 def init():
     # Default loguru handler sends everything to stderr,
     # which is not desired. Rather only errors and
     # critical errors should be outputted to stderr.
-    logger.remove(DEFAULT_ID)
+    # (It is already gone if init() has been run before.)
+    try:
+        logger.remove(DEFAULT_ID)
+    except ValueError:
+        pass
+    while _handler_id_list:
+        logger.remove(_handler_id_list.pop())
 
     # Functions are needed to set the format of
     # error messages sent to stderr.
@@ -71,13 +101,11 @@ def init():
         error_list.append(os.linesep)
         return "".join(error_list)
 
-    # Errors resulting from other (non-fatal) errors
-    # corresponds to a new level: failure.
-    logger.level("FAILURE", no=35, color="<red>", icon="!")
+    add_levels()
 
     # The amount of details provided depends on if debugging is enabled.
     if common.is_debug:
-        logger.add(
+        _add_handler(
             sys.stderr,
             backtrace=True,
             diagnose=True,
@@ -85,7 +113,7 @@ def init():
             filter=_lev_filter("DEBUG"),
             level="DEBUG",
         )
-    logger.add(
+    _add_handler(
         sys.stderr,
         backtrace=common.is_debug,
         diagnose=common.is_debug,
@@ -93,7 +121,7 @@ def init():
         filter=_lev_filter("ERROR"),
         level="ERROR",
     )
-    logger.add(
+    _add_handler(
         sys.stderr,
         backtrace=common.is_debug,
         diagnose=common.is_debug,
@@ -101,7 +129,7 @@ def init():
         filter=_lev_filter("FAILURE"),
         level="FAILURE",
     )
-    logger.add(
+    _add_handler(
         sys.stderr,
         backtrace=True,
         diagnose=common.is_debug,
@@ -121,13 +149,16 @@ def set_log(logfile):
                 return False
         return True
 
-    logger.add(
+    # Messages are written to the file by a separate thread
+    # (enqueue), so that converting doesn't wait on the disk.
+    _add_handler(
         logfile,
         backtrace=True,
         catch=True,
         diagnose=common.is_debug,
         filter=filter_debug,
         errors="replace",
+        enqueue=True,
     )
 
     # Add script name and version to log.
@@ -143,6 +174,45 @@ def set_log(logfile):
         logger.info("Debug Mode has been enabled.")
 
 
+# Where a message was logged from, as recorded by loguru.
+ORIGIN_KEYS = ("name", "function", "line")
+
+
+# Worker processes are started from scratch instead of being copies
+# of this process, so they don't inherit the log handlers or anything
+# else. What they log is captured with capture_log() and sent back to
+# be logged again here with replay_log().
+def get_worker_context():
+    import multiprocessing
+
+    return multiprocessing.get_context("spawn")
+
+
+# Sends every message logged from now on to log_func instead of the
+# usual handlers, as a tuple of the level, the message and a dictionary
+# of where it was logged from (see replay_log()).
+def capture_log(log_func):
+    def _capture(message):
+        record = message.record
+        log_func(
+            (
+                record["level"].name,
+                record["message"],
+                {key: record[key] for key in ORIGIN_KEYS},
+            )
+        )
+
+    logger.remove()
+    logger.add(_capture, level=0, format="{message}")
+    add_levels()
+
+
+# Logs message as if it came from the place in origin_dict
+# (such as in a worker process) instead of from here.
+def replay_log(level, message, origin_dict):
+    logger.patch(lambda record: record.update(origin_dict)).log(level, message)
+
+
 def get_default_logname():
     logname_list = []
     logname_list.append(f"invconv-{time.strftime('%m-%d-%Y_%H-%M-%S')}")
@@ -164,10 +234,88 @@ def get_default_logname():
     return logname
 
 
+# What does_continue() does once a non-critical error is reached:
+# prompt asks the user, skip leaves out whatever had the error, fail
+# stops the conversion and collect is the same as skip, but also keeps
+# a report of everything that was left out or replaced by a default
+# value (see write_report()).
+POLICY_PROMPT = "prompt"
+POLICY_SKIP = "skip"
+POLICY_FAIL = "fail"
+POLICY_COLLECT = "collect"
+POLICY_TUPLE = (POLICY_PROMPT, POLICY_SKIP, POLICY_FAIL, POLICY_COLLECT)
+
+# If None, the user is only asked if there
+# is somebody there to answer (a terminal).
+error_policy = None
+
+# Sections that were skipped and cells that were given a
+# default value, as dicts. Only kept with POLICY_COLLECT.
+_skipped_list = []
+_cell_list = []
+
+
+def get_error_policy():
+    if error_policy is not None:
+        return error_policy
+    if sys.stdin is not None and sys.stdin.isatty():
+        return POLICY_PROMPT
+    return POLICY_FAIL
+
+
+def reset_report():
+    global _skipped_list
+    global _cell_list
+    _skipped_list = []
+    _cell_list = []
+
+
+def get_report():
+    return {"skipped": list(_skipped_list), "cells": list(_cell_list)}
+
+
+# Adds the entries of another report (such as one
+# made by a different process) to this one.
+def add_report(report_dict):
+    _skipped_list.extend(report_dict["skipped"])
+    _cell_list.extend(report_dict["cells"])
+
+
+def write_report(report_path):
+    with open(report_path, "w") as report_fptr:
+        json.dump(get_report(), report_fptr, indent=2)
+        report_fptr.write("\n")
+
+
+# Decides what to do once a non-critical error has been reached in
+# file_section (after it has been logged). kind is a short description
+# of the error, such as "unknown dimensions". Returns True if the
+# script should go on as if nothing happened or False if file_section
+# should be skipped. With POLICY_FAIL, InvconvStopped is raised instead.
+def does_continue(kind="error", file_section=None, section_type="SECTION"):
+    policy = get_error_policy()
+    if policy == POLICY_PROMPT:
+        ask_continue()
+        return True
+    section_id = kind
+    if file_section is not None:
+        section_id = f"{kind} in {get_id(file_section, section_type)}"
+    if policy == POLICY_FAIL:
+        logger.log("FAILURE", f"Stopping because of {section_id}.")
+        raise InvconvStopped(section_id)
+    if policy == POLICY_COLLECT:
+        skipped_dict = {"kind": kind, "file": None, "section": None}
+        if file_section is not None:
+            skipped_dict["file"], skipped_dict["section"] = file_section
+        _skipped_list.append(skipped_dict)
+    logger.info(f"Skipping because of {section_id}.")
+    return False
+
+
 # Asks the user if they want to terminate the script
 # (typically done if a non-critical error has been
 # reached).
-def does_continue():
+def ask_continue():
     print("Do you want to terminate the script? [y/n] > ", end="", file=sys.stderr)
     response = input()
     if response.lower() == "y" or response.lower() == "yes":
@@ -186,3 +334,89 @@ def get_id(file_section, section_type="SECTION"):
     filepath, sectionname = file_section
     upper_section_type = section_type.upper() + ":"
     return f"{filepath} {upper_section_type} {str(sectionname)}"
+
+
+# Warnings that keep coming up in the same file-section pair (such as
+# a whole column of cells without a price) are only logged the first
+# few times. After that, they are only counted, and flush_warnings()
+# logs how many of them were left out.
+MAX_WARNING_SAMPLES = 5
+
+# Number of warnings given so far, indexed
+# by kind of warning and file-section pair.
+_warning_dict = {}
+# Warnings can be given by more than one thread at a time
+# (such as the reader and transform threads of pipeline.py).
+_warning_lock = threading.Lock()
+
+
+def reset_warnings():
+    global _warning_dict
+    with _warning_lock:
+        _warning_dict = {}
+
+
+# If set, warn() passes every warning on to this function instead, such
+# as in worker processes that leave counting warnings to the main process.
+# It is given the arguments of add_warning(), followed by a dictionary
+# of where warn() was called from (with the "name", "function" and "line"
+# that loguru would have recorded).
+warning_handler = None
+
+
+# Counts a warning given through warn(). Returns the message
+# to log or None if the warning should be left out.
+def add_warning(kind, file_section, template, section_type, field_dict):
+    warning_key = (kind, file_section, section_type)
+    with _warning_lock:
+        num_warnings = _warning_dict.get(warning_key, 0) + 1
+        _warning_dict[warning_key] = num_warnings
+        if error_policy == POLICY_COLLECT:
+            file_name, section_name = file_section
+            _cell_list.append(
+                {"kind": kind, "file": file_name, "section": section_name, **field_dict}
+            )
+    if num_warnings > MAX_WARNING_SAMPLES:
+        return None
+    return string.Template(template).substitute(
+        id=get_id(file_section, section_type), **field_dict
+    )
+
+
+# Gives a warning of a certain kind (a short description, such as
+# "missing price") about file_section. template is a string.Template
+# and $id in it is replaced by the ID of file_section (see get_id()).
+# The message is only put together if the warning is actually logged.
+def warn(kind, file_section, template, section_type="SECTION", **field_dict):
+    if warning_handler is not None:
+        caller = sys._getframe(1)
+        origin_dict = {
+            "name": caller.f_globals.get("__name__"),
+            "function": caller.f_code.co_name,
+            "line": caller.f_lineno,
+        }
+        warning_handler(
+            kind, file_section, template, section_type, field_dict, origin_dict
+        )
+        return
+    message = add_warning(kind, file_section, template, section_type, field_dict)
+    if message is not None:
+        # Logged as if it came from whoever called warn().
+        logger.opt(depth=1).warning(message)
+
+
+# Logs how many warnings were left out by warn() and starts over.
+def flush_warnings():
+    with _warning_lock:
+        warning_list = list(_warning_dict.items())
+        _warning_dict.clear()
+    for (kind, file_section, section_type), num_warnings in warning_list:
+        num_hidden = num_warnings - MAX_WARNING_SAMPLES
+        if num_hidden <= 0:
+            continue
+        # The number is kept with the message for
+        # anything that counts the warnings given.
+        logger.bind(num_hidden=num_hidden).warning(
+            f"{num_hidden} more warning(s) of the kind {kind!r} in "
+            f"{get_id(file_section, section_type)} were not logged."
+        )
@@ -0,0 +1,151 @@
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+# Runs a conversion as three stages connected by queues, so that
+# reading the input files, turning the input into Axelor rows and
+# writing those rows can happen at the same time:
+#
+#   reader thread -> read queue -> transform thread -> write queue -> writer
+#
+# The queues have a maximum size, so a stage that gets too far ahead
+# waits for the next one to catch up. Batches go through the queues in
+# the order they were read and there is only one transform thread, as
+# logic_func numbers codes based on the order of the rows. The output
+# is therefore the same as when converting without the pipeline.
+
+import queue
+import threading
+
+try:
+    import logic
+    import sink
+except ModuleNotFoundError:
+    import invconv.logic as logic
+    import invconv.sink as sink
+
+# Maximum number of batches waiting in each queue.
+DEFAULT_QUEUE_SIZE = 8
+# Number of input rows read before passing them on.
+DEFAULT_BATCH_ROWS = 64
+# How long (in seconds) a stage waits on a full or
+# empty queue before checking if it should stop.
+POLL_TIME = 0.1
+
+# Put in a queue once a stage has nothing else to pass on.
+_DONE = object()
+
+
+class Pipeline:
+    def __init__(
+        self, data_list, queue_size=DEFAULT_QUEUE_SIZE, batch_rows=DEFAULT_BATCH_ROWS
+    ):
+        self.data_list = data_list
+        self.batch_rows = batch_rows
+        self._read_queue = queue.Queue(queue_size)
+        self._write_queue = queue.Queue(queue_size)
+        self._stop_event = threading.Event()
+        # The first exception raised in a stage, which gets
+        # raised again in the thread that called run().
+        self._error = None
+
+    def _put(self, target_queue, item):
+        while not self._stop_event.is_set():
+            try:
+                target_queue.put(item, timeout=POLL_TIME)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _get(self, source_queue):
+        while not self._stop_event.is_set():
+            try:
+                return source_queue.get(timeout=POLL_TIME)
+            except queue.Empty:
+                pass
+        return _DONE
+
+    def _run_stage(self, stage_func, out_queue):
+        try:
+            stage_func()
+        except BaseException as stage_error:
+            if self._error is None:
+                self._error = stage_error
+            self._stop_event.set()
+        finally:
+            self._put(out_queue, _DONE)
+
+    def _read(self):
+        for data_tuple in self.data_list:
+            row_list = []
+            for row in data_tuple.rows():
+                row_list.append(row)
+                if len(row_list) >= self.batch_rows:
+                    if not self._put(self._read_queue, (data_tuple, row_list)):
+                        return
+                    row_list = []
+            if row_list and not self._put(self._read_queue, (data_tuple, row_list)):
+                return
+
+    def _transform(self):
+        # Used in place of the output sink while transforming, so that
+        # the rows committed by logic end up in the write queue instead.
+        batch_sink = sink.RowBuffer()
+        old_sink = logic.get_sink()
+        logic.set_sink(batch_sink)
+        try:
+            while (batch := self._get(self._read_queue)) is not _DONE:
+                data_tuple, row_list = batch
+                logic.init(
+                    data_tuple.filename, data_tuple.sectionname, data_tuple.headers
+                )
+                num_cells = 0
+                for row in row_list:
+                    for val in row:
+                        logic.main(val)
+                    num_cells += len(row)
+                file_section = (data_tuple.filename, data_tuple.sectionname)
+                if not self._put(
+                    self._write_queue, (file_section, batch_sink.take(), num_cells)
+                ):
+                    return
+        finally:
+            logic.set_sink(old_sink)
+
+    # Runs the reader and transform stages in their own threads while
+    # the calling thread writes the rows to sink. progress is called with
+    # the file-section pair and number of cells of every batch written.
+    def run(self, sink, progress=None):
+        thread_list = [
+            threading.Thread(
+                target=self._run_stage,
+                args=(self._read, self._read_queue),
+                name="invconv-reader",
+                daemon=True,
+            ),
+            threading.Thread(
+                target=self._run_stage,
+                args=(self._transform, self._write_queue),
+                name="invconv-transform",
+                daemon=True,
+            ),
+        ]
+        for thread in thread_list:
+            thread.start()
+        try:
+            while (batch := self._get(self._write_queue)) is not _DONE:
+                file_section, row_list, num_cells = batch
+                sink.write_rows(row_list)
+                if progress is not None:
+                    progress(file_section, num_cells)
+        finally:
+            # Stops the other stages if writing failed.
+            self._stop_event.set()
+            for thread in thread_list:
+                thread.join()
+        if self._error is not None:
+            raise self._error
+
+
+def run(data_list, sink, progress=None, **settings):
+    Pipeline(data_list, **settings).run(sink, progress)
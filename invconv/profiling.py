@@ -0,0 +1,99 @@
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+# Profiles every stage of a conversion separately with cProfile. Each
+# stage gets its own .pstats file in profile_dir (which can be looked
+# at with "python -m pstats") and its hotspots are written to the log.
+# Only one stage is profiled at a time: starting a stage while another
+# one is running pauses the other one until the new stage is done.
+#
+# cProfile only profiles the thread it was started in, so with --pipeline
+# the transform stage only covers the main thread and with --jobs it
+# doesn't cover the worker processes.
+#
+# cProfile and pstats are only imported once something is profiled.
+
+import contextlib
+import io
+import os
+
+from loguru import logger
+
+# Where the .pstats files are written. Nothing
+# is profiled unless this is set.
+profile_dir = None
+
+# Number of functions listed for every stage in the log.
+NUM_HOTSPOTS = 20
+
+# Indexed by the name of the stage.
+_profile_dict = {}
+# Stages that are currently running, the last of which is being profiled.
+_active_list = []
+
+
+def reset():
+    global profile_dir
+    profile_dir = None
+    _profile_dict.clear()
+    _active_list.clear()
+
+
+@contextlib.contextmanager
+def stage(name):
+    if profile_dir is None:
+        yield
+        return
+    import cProfile
+
+    profile = _profile_dict.get(name)
+    if profile is None:
+        profile = _profile_dict[name] = cProfile.Profile()
+    if _active_list:
+        _active_list[-1].disable()
+    _active_list.append(profile)
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        _active_list.pop()
+        if _active_list:
+            _active_list[-1].enable()
+
+
+# Writes the .pstats file of every stage that was
+# profiled and logs the functions that took the most time.
+def save():
+    import pstats
+
+    os.makedirs(profile_dir, exist_ok=True)
+    for name, profile in _profile_dict.items():
+        pstats_path = os.path.join(profile_dir, name + ".pstats")
+        profile.dump_stats(pstats_path)
+        stats_stream = io.StringIO()
+        stats = pstats.Stats(profile, stream=stats_stream)
+        stats.sort_stats(pstats.SortKey.TIME).print_stats(NUM_HOTSPOTS)
+        logger.info(
+            f"Hotspots of stage {name} (saved to {pstats_path}):\n"
+            + stats_stream.getvalue().strip("\n")
+        )
+
+
+# Passes rows on to sink while profiling
+# the writing as its own stage.
+class ProfiledSink:
+    def __init__(self, sink, name="write"):
+        self.sink = sink
+        self.name = name
+
+    def write_row(self, row):
+        with stage(self.name):
+            self.sink.write_row(row)
+
+    def write_rows(self, rows):
+        with stage(self.name):
+            self.sink.write_rows(rows)
+
+    def close(self):
+        self.sink.close()
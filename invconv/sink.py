@@ -0,0 +1,295 @@
+# Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
+# SPDX-license-identifier: 0BSD
+
+import csv
+import importlib.util
+import io
+import json
+import os
+
+from loguru import logger
+
+try:
+    from exceptions import InvconvArgumentError
+except ModuleNotFoundError:
+    from invconv.exceptions import InvconvArgumentError
+
+# zstandard isn't part of the standard library,
+# so .csv.zst output is only available if it is installed.
+zstd_used = importlib.util.find_spec("zstandard") is not None
+
+ZSTD_EXT = ".csv.zst"
+
+
+# The compression modules are only imported
+# once a compressed output file is opened.
+def _open_gzip(output_path):
+    import gzip
+
+    return gzip.open(output_path, "at", compresslevel=6, newline="")
+
+
+def _open_xz(output_path):
+    import lzma
+
+    return lzma.open(output_path, "at", newline="")
+
+
+def _open_zstd(output_path):
+    import zstandard
+
+    zstd_fptr = zstandard.ZstdCompressor().stream_writer(open(output_path, "ab"))
+    return io.TextIOWrapper(zstd_fptr, newline="")
+
+
+# Functions opening a compressed output file for appending text,
+# indexed by extension. The output is compressed as it is written.
+OPENER_DICT = {
+    ".csv.gz": _open_gzip,
+    ".csv.xz": _open_xz,
+}
+if zstd_used:
+    OPENER_DICT[ZSTD_EXT] = _open_zstd
+
+
+# Extensions of the output files that can be written to.
+def get_extensions():
+    return (".csv",) + tuple(OPENER_DICT)
+
+
+# Returns the output file for output_path, which is either the file
+# itself or the directory to put it in (named after csv_type, such as
+# "Product.csv"). Unless replace is False, the output file is emptied
+# (or created), as the sinks only ever append to it.
+def get_output_path(output_path, csv_type, replace=True):
+    if output_path.endswith(ZSTD_EXT) and not zstd_used:
+        logger.error("Writing .csv.zst files needs the zstandard package.")
+        raise InvconvArgumentError
+    # Checks if a file already exists (which gets replaced) or if
+    # ".csv" (or a compressed version of it, like ".csv.gz") exists
+    # in output_path (in which case, file gets created).
+    if os.path.isfile(output_path) or output_path.endswith(get_extensions()):
+        pass
+    elif os.path.isdir(output_path):
+        output_path = os.path.join(output_path, csv_type.title() + ".csv")
+    else:
+        raise InvconvArgumentError
+    if replace:
+        with open(output_path, "w", newline=""):
+            pass
+    return output_path
+
+
+# Opens output_path for appending text, compressing
+# it if its extension is in OPENER_DICT.
+def open_output(output_path):
+    for ext, opener in OPENER_DICT.items():
+        if output_path.endswith(ext):
+            return opener(output_path)
+    return open(output_path, "a", newline="")
+
+
+# Writes rows to the output file (or stream), which is
+# only opened once instead of for every row.
+class CsvSink:
+    def __init__(self, output):
+        self.output = output
+        self._fptr = None
+        self._csv_out = None
+
+    def open(self):
+        if self._csv_out is not None:
+            return
+        if isinstance(self.output, str):
+            # The output file has already been emptied
+            # (or created) by get_output_path(), so
+            # everything gets appended to it.
+            self._fptr = open_output(self.output)
+            self._csv_out = csv.writer(self._fptr, dialect="excel")
+        else:
+            self._csv_out = csv.writer(self.output, dialect="excel")
+
+    def write_row(self, row):
+        self.open()
+        self._csv_out.writerow(row)
+
+    def write_rows(self, rows):
+        self.open()
+        self._csv_out.writerows(rows)
+
+    write_header = write_row
+
+    def close(self):
+        # Streams such as sys.stdout are left open,
+        # since they don't belong to the sink.
+        if self._fptr is not None:
+            self._fptr.close()
+        elif self._csv_out is not None:
+            self.output.flush()
+        self._fptr = None
+        self._csv_out = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+# Keeps the rows written to it until they are taken, such as
+# when logic converts rows that are written somewhere else later.
+class RowBuffer:
+    def __init__(self):
+        self.row_list = []
+
+    def write_row(self, row):
+        self.row_list.append(row)
+
+    # Returns the rows written so far and starts over.
+    def take(self):
+        row_list = self.row_list
+        self.row_list = []
+        return row_list
+
+
+# Counts the bytes written to fptr, before it gets compressed (if it
+# does). csv.writer writes every row with a single call to write().
+class _CountingFile:
+    def __init__(self, fptr):
+        self.fptr = fptr
+        self.num_bytes = 0
+
+    def write(self, text):
+        if text.isascii():
+            self.num_bytes += len(text)
+        else:
+            self.num_bytes += len(text.encode(self.fptr.encoding))
+        return self.fptr.write(text)
+
+
+# Writes rows to a series of output files (shards) instead of a single
+# one, moving on to the next shard once the current one has max_rows
+# rows or max_bytes bytes (before compression) in it. A shard can go
+# over max_bytes by a single row. Every shard starts with the header.
+# Shards are named after output_path: "Product.csv" becomes
+# "Product-0001.csv", "Product-0002.csv" and so on, which are listed
+# in a manifest ("Product.shards.json") once the sink is closed. For
+# every shard, the manifest has its size on disk ("bytes", after
+# compression) and before compression ("csv_bytes"). If is_complete
+# is unset by the time the sink is closed (such as when the
+# conversion failed), the manifest says the output is incomplete.
+class ShardedSink:
+    def __init__(self, output_path, max_rows=None, max_bytes=None):
+        self.output_path = output_path
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self._base_path, self._ext = _split_ext(output_path)
+        self._header = None
+        self._import_id_index = None
+        self._fptr = None
+        self._count_fptr = None
+        self._csv_out = None
+        self._shard_path = None
+        # Every shard written so far, as a dict
+        # that ends up in the manifest.
+        self.shard_list = []
+        self.is_complete = True
+
+    def get_manifest_path(self):
+        return self._base_path + ".shards.json"
+
+    def _close_shard(self):
+        if self._fptr is None:
+            return
+        self._fptr.close()
+        shard_dict = self.shard_list[-1]
+        shard_dict["bytes"] = os.path.getsize(self._shard_path)
+        shard_dict["csv_bytes"] = self._count_fptr.num_bytes
+        self._fptr = None
+        self._count_fptr = None
+        self._csv_out = None
+
+    def _open_shard(self):
+        self._close_shard()
+        shard_path = f"{self._base_path}-{len(self.shard_list) + 1:04}{self._ext}"
+        # Replace the shard if it already existed.
+        with open(shard_path, "w", newline=""):
+            pass
+        self._shard_path = shard_path
+        self._fptr = open_output(shard_path)
+        self._count_fptr = _CountingFile(self._fptr)
+        self._csv_out = csv.writer(self._count_fptr, dialect="excel")
+        self._csv_out.writerow(self._header)
+        self.shard_list.append(
+            {
+                "path": os.path.basename(shard_path),
+                "rows": 0,
+                "bytes": 0,
+                "csv_bytes": 0,
+                "first_import_id": None,
+                "last_import_id": None,
+            }
+        )
+
+    def _is_full(self):
+        shard_dict = self.shard_list[-1]
+        if self.max_rows is not None and shard_dict["rows"] >= self.max_rows:
+            return True
+        return (
+            self.max_bytes is not None and self._count_fptr.num_bytes >= self.max_bytes
+        )
+
+    def write_header(self, row):
+        self._header = list(row)
+        if "importId" in self._header:
+            self._import_id_index = self._header.index("importId")
+
+    def write_row(self, row):
+        if self._csv_out is None or self._is_full():
+            self._open_shard()
+        self._csv_out.writerow(row)
+        shard_dict = self.shard_list[-1]
+        shard_dict["rows"] += 1
+        if self._import_id_index is not None:
+            import_id = row[self._import_id_index]
+            if shard_dict["first_import_id"] is None:
+                shard_dict["first_import_id"] = import_id
+            shard_dict["last_import_id"] = import_id
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write_row(row)
+
+    def close(self):
+        # Without any rows, there is still a shard with
+        # the header, the same as a file that isn't split.
+        if not self.shard_list and self._header is not None:
+            self._open_shard()
+        self._close_shard()
+        manifest_dict = {
+            "complete": self.is_complete,
+            "header": self._header,
+            "rows": sum(shard_dict["rows"] for shard_dict in self.shard_list),
+            "shards": self.shard_list,
+        }
+        with open(self.get_manifest_path(), "w") as manifest_fptr:
+            json.dump(manifest_dict, manifest_fptr, indent=2)
+            manifest_fptr.write("\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is not None:
+            self.is_complete = False
+        self.close()
+
+
+# Splits output_path into the part before the
+# extension and the extension (such as ".csv.gz").
+def _split_ext(output_path):
+    for ext in sorted(get_extensions(), key=len, reverse=True):
+        if output_path.endswith(ext):
+            return output_path[: -len(ext)], ext
+    return os.path.splitext(output_path)
@@ -1,6 +1,7 @@
 # Copyright 2021 Richard Johnston <techpowerawaits@outlook.com>
 # SPDX-license-identifier: 0BSD
 
+import importlib.util
 import string
 
 from loguru import logger
@@ -16,12 +17,17 @@ except ModuleNotFoundError:
     import invconv.ftype as ftype
     import invconv.msg_handler as msg_handler
 
-used = True
+# openpyxl is only imported once a workbook is opened,
+# as importing it takes longer than everything else the
+# script needs in order to start.
+used = importlib.util.find_spec("openpyxl") is not None
+
+
+def load_workbook(filename, **settings):
+    import openpyxl
+
+    return openpyxl.load_workbook(filename, **settings)
 
-try:
-    from openpyxl import load_workbook
-except ModuleNotFoundError:
-    used = False
 
 # load_workbook is used repeatedly with similar settings
 # every time.
@@ -77,21 +83,59 @@ class XlsxDataTuple(ftype.BasicFtypeDataClass):
         wb = self.load_workbook()
         ws = wb[self.wsname]
         cell_val = ws[col_letter + row_str].value
-        return_str = str(cell_val)
+        return_str = self._get_cell_str(cell_val, self.cur_col, self.cur_row)
+        self.cur_col += 1
+        wb.close()
+        return return_str
+
+    # Reads the worksheet a row at a time instead of
+    # opening the workbook again for every cell.
+    def rows(self, min_row=None, max_row=None):
+        first_row = self.min_row
+        last_row = self.max_row
+        if min_row is not None:
+            first_row = max(first_row, self.min_row + min_row)
+        if max_row is not None:
+            last_row = min(last_row, self.min_row + max_row - 1)
+        if first_row > last_row:
+            return
+        num_col = self.max_col - self.min_col + 1
+        wb = self.load_workbook()
+        try:
+            ws = wb[self.wsname]
+            row_iter = ws.iter_rows(
+                min_row=first_row,
+                max_row=last_row,
+                min_col=self.min_col,
+                max_col=self.max_col,
+                values_only=True,
+            )
+            for row_num, cell_tuple in enumerate(row_iter, first_row):
+                row_list = []
+                for col_num in range(num_col):
+                    cell_val = None
+                    if col_num < len(cell_tuple):
+                        cell_val = cell_tuple[col_num]
+                    row_list.append(
+                        self._get_cell_str(cell_val, col_num + self.min_col, row_num)
+                    )
+                yield row_list
+        finally:
+            wb.close()
+
+    def _get_cell_str(self, cell_val, col, row):
         if cell_val is None:
-            return_str = ""
+            return ""
+        return_str = str(cell_val)
         if return_str == "#REF!":
-            logger.warning(
-                string.Template(
-                    'Unknown reference found at $cell_pos in $id. Defaulting to "unknown".'
-                ).substitute(
-                    cell_pos=col_letter + row_str,
-                    id=msg_handler.get_id((self.filename, self.wsname), "WS"),
-                )
+            msg_handler.warn(
+                "unknown reference",
+                (self.filename, self.wsname),
+                'Unknown reference found at $cell_pos in $id. Defaulting to "unknown".',
+                "WS",
+                cell_pos=cell_pos.get_col_letter(col) + str(row),
             )
             return_str = "unknown"
-        self.cur_col += 1
-        wb.close()
         return return_str
 
 
@@ -101,6 +145,14 @@ xlsx_data_list = ftype.FtypeDataList()
 # Contains just a list of file, worksheet tuples.
 xlsx_tuple_list = []
 
+
+def reset():
+    global xlsx_data_list
+    global xlsx_tuple_list
+    xlsx_data_list = ftype.FtypeDataList()
+    xlsx_tuple_list = []
+
+
 # xlsx files always start counting at 1.
 INVALID_ROW = 0
 
@@ -136,7 +188,8 @@ def start(input_files):
             logger.error(
                 f"{msg_handler.get_id(file_section, 'ws')} contains no valid headers."
             )
-            msg_handler.does_continue()
+            # The worksheet is left out either way.
+            msg_handler.does_continue("no valid headers", file_section, "WS")
     return xlsx_data_list
 
 
@@ -150,6 +203,7 @@ def get_worksheets(input_files):
 
 
 def set_data():
+    skipped_list = []
     for filename, wsname in xlsx_tuple_list:
         wb = load_workbook(filename, **WB_SETTINGS)
         ws = wb[wsname]
@@ -161,7 +215,12 @@ def set_data():
         # gets closed or crashes.
         wb.close()
         max_col = get_max_col(filename, wsname, cur_max_col)
-        max_row = get_max_row(filename, wsname, cur_max_row)
+        max_row = None
+        if max_col is not None:
+            max_row = get_max_row(filename, wsname, cur_max_row)
+        if max_row is None:
+            skipped_list.append((filename, wsname))
+            continue
         # Get the row where a header was found.
         header_row = get_header_row(filename, wsname, max_row)
         # check_header_row() ensures that a non-blank row
@@ -186,13 +245,21 @@ def set_data():
         DataTuple = XlsxDataTuple(filename, wsname, header_list)
         DataTuple.set_oper_num(min_row, max_row, max_col)
         xlsx_data_list.append(DataTuple)
+    # Skipped worksheets have already been dealt with, so they
+    # aren't reported again for not being in xlsx_data_list.
+    for file_section in skipped_list:
+        xlsx_tuple_list.remove(file_section)
 
 
 def get_max_col(filename, wsname, max_col):
     xlsx_id = msg_handler.get_id((filename, wsname), "WS")
     while (not isinstance(max_col, int)) or (max_col <= INVALID_ROW):
         logger.error(f"Max col for {xlsx_id} is {str(max_col)}.")
-        msg_handler.does_continue()
+        # Returns None if the worksheet should be skipped.
+        if not msg_handler.does_continue(
+            "unknown dimensions", (filename, wsname), "WS"
+        ):
+            return None
         try:
             logger.info("User providing number of columns (starting at 1).")
             max_col = int(
@@ -210,7 +277,9 @@ def get_max_row(filename, wsname, max_row):
     xlsx_id = msg_handler.get_id((filename, wsname))
     while (not isinstance(max_row, int)) or (max_row <= 0):
         logger.error(f"Max row for {xlsx_id} is {str(max_row)}.")
-        msg_handler.does_continue()
+        # Returns None if the worksheet should be skipped.
+        if not msg_handler.does_continue("unknown dimensions", (filename, wsname)):
+            return None
         try:
             logger.info("User providing number of rows (starting at 1).")
             max_row = int(input("Please provide the number of rows (starting at 1) > "))
@@ -277,8 +346,12 @@ def get_header_list(filename, wsname, max_col, header_row):
         # Assuming the header doesn't have blank
         # items between entries. Only at the end.
         if header_item is None:
-            logger.warning(
-                f"Blank header {col_letter+row_str} in {msg_handler.get_id((filename, wsname), 'WS')} will be ignored."
+            msg_handler.warn(
+                "blank header",
+                (filename, wsname),
+                "Blank header $cell_pos in $id will be ignored.",
+                "WS",
+                cell_pos=col_letter + row_str,
             )
             break
         header_list.append(header_item)